@@ -0,0 +1,416 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.request import urlopen
+
+from exceptions import StopExecution
+from executors import EXECUTION_MODES
+from http_jobs import default_pool, http_request
+from job import Job
+from logs import QueuedFileHandler, log_event, writer
+from profiling import Profiler
+from scheduler import Scheduler
+from storage import SQLiteTaskStore
+from utils import scheduler_logger, task_logger, START_AT_FORMAT
+
+
+WORKLOADS = ('noop', 'cpu', 'sleep')
+HTTP_CLIENTS = ('urlopen', 'pool')
+LOG_HANDLERS = ('file', 'queued')
+PROFILE_MODES = ('off', 'sampled', 'cpu', 'memory')
+
+
+def noop() -> None:
+    return None
+
+
+def cpu_bound(n: int = 10_000) -> int:
+    return sum(i * i for i in range(n))
+
+
+def sleep_bound(seconds: float = 0.001) -> None:
+    time.sleep(seconds)
+
+
+def make_job(workload: str) -> Job:
+    if workload == 'cpu':
+        return Job(func=cpu_bound)
+    if workload == 'sleep':
+        return Job(func=sleep_bound)
+    if workload == 'deferred':
+        start_at = datetime.now() + timedelta(days=1)
+        return Job(func=noop, start_at=start_at.strftime(START_AT_FORMAT))
+    return Job(func=noop)
+
+
+def make_scheduler(folder: str, **kwargs: Any) -> Scheduler:
+    return Scheduler(
+        tasks_folder=os.path.join(folder, 'tasks') + os.sep,
+        statuses_file=os.path.join(folder, 'statuses.txt'),
+        waiting_tasks_file=os.path.join(folder, 'waiting_tasks.txt'),
+        **kwargs
+    )
+
+
+def bench_schedule(jobs: int, pool_size: int) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as folder:
+        sh = make_scheduler(folder, pool_size=pool_size)
+        started = time.perf_counter()
+        for _ in range(jobs):
+            sh.schedule(Job(func=noop))
+        seconds = time.perf_counter() - started
+    return {
+        'benchmark': 'schedule', 'jobs': jobs, 'pool_size': pool_size,
+        'seconds': seconds, 'jobs_per_second': jobs / seconds
+    }
+
+
+def bench_schedule_many(jobs: int, pool_size: int,
+                        store: str = 'file') -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as folder:
+        task_store = (
+            SQLiteTaskStore(os.path.join(folder, 'tasks.db'))
+            if store == 'sqlite' else None
+        )
+        sh = make_scheduler(folder, pool_size=pool_size,
+                            task_store=task_store)
+        batch = [Job(func=noop) for _ in range(jobs)]
+        started = time.perf_counter()
+        sh.schedule_many(batch)
+        seconds = time.perf_counter() - started
+    return {
+        'benchmark': 'schedule_many', 'store': store, 'jobs': jobs,
+        'pool_size': pool_size, 'seconds': seconds,
+        'jobs_per_second': jobs / seconds
+    }
+
+
+def bench_throughput(jobs: int, workload: str, mode: str,
+                     pool_size: int) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as folder:
+        sh = make_scheduler(folder, pool_size=pool_size, execution_mode=mode)
+        for _ in range(jobs):
+            sh.schedule(make_job(workload))
+        runner = threading.Thread(target=sh.run)
+        started = time.perf_counter()
+        runner.start()
+        while sh.current_count_tasks.value > 0:  # type: ignore
+            time.sleep(0.005)
+        seconds = time.perf_counter() - started
+        sh.queue.put(StopExecution)
+        runner.join()
+    waits = [
+        histogram for (name, _), histogram in sh.metrics.histograms.items()
+        if name == 'queue_wait_seconds'
+    ]
+    return {
+        'benchmark': 'throughput', 'workload': workload, 'mode': mode,
+        'jobs': jobs, 'pool_size': pool_size, 'seconds': seconds,
+        'jobs_per_second': jobs / seconds,
+        'queue_wait_p50': waits[0].quantile(0.5) if waits else None,
+        'queue_wait_p99': waits[0].quantile(0.99) if waits else None
+    }
+
+
+def bench_recovery(jobs: int, pool_size: int,
+                   checkpointed: bool = True) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as folder:
+        sh = make_scheduler(folder, pool_size=pool_size)
+        sh.schedule_many([make_job('deferred') for _ in range(jobs)])
+        if checkpointed:
+            sh.statuses.compact()
+            sh.waiting.compact()
+        tracemalloc.start()
+        started = time.perf_counter()
+        restarted = make_scheduler(folder, pool_size=pool_size)
+        run_coroutine = restarted._run_coroutine()
+        run_coroutine.send(None)
+        seconds = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        restarted.waiting.journal.load_remaining()
+        full_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        try:
+            run_coroutine.throw(StopExecution)
+        except StopIteration:
+            pass
+    return {
+        'benchmark': 'recovery', 'checkpointed': checkpointed, 'jobs': jobs,
+        'pool_size': pool_size, 'seconds_to_first_dispatch': seconds,
+        'startup_bytes': memory, 'bytes_per_job': full_memory / jobs
+    }
+
+
+def bench_tenants(jobs: int, pool_size: int, fair: bool) -> dict[str, Any]:
+    small_jobs = max(jobs // 100, 1)
+    with tempfile.TemporaryDirectory() as folder:
+        sh = make_scheduler(
+            folder, pool_size=pool_size, execution_mode='thread',
+            tenant_weights={'small': 4} if fair else None
+        )
+        sh.schedule_many([
+            Job(func=sleep_bound, tenant='bulk' if fair else '')
+            for _ in range(jobs)
+        ])
+        sh.schedule_many([
+            Job(func=noop, tenant='small' if fair else '')
+            for _ in range(small_jobs)
+        ])
+        runner = threading.Thread(target=sh.run)
+        started = time.perf_counter()
+        runner.start()
+        while sh.current_count_tasks.value > 0:  # type: ignore
+            time.sleep(0.005)
+        seconds = time.perf_counter() - started
+        sh.queue.put(StopExecution)
+        runner.join()
+    bulk = sh.metrics.histogram('queue_wait_seconds', 'sleep_bound')
+    small = sh.metrics.histogram('queue_wait_seconds', 'noop')
+    return {
+        'benchmark': 'tenants', 'fair': fair, 'bulk_jobs': jobs,
+        'small_jobs': small_jobs, 'pool_size': pool_size,
+        'seconds': seconds,
+        'bulk_wait_p50': bulk.quantile(0.5),  # type: ignore
+        'small_wait_p50': small.quantile(0.5),  # type: ignore
+        'small_wait_p99': small.quantile(0.99)  # type: ignore
+    }
+
+
+def bench_graph(nodes: int, shape: str) -> dict[str, Any]:
+    if shape == 'deep':
+        job = Job(func=noop)
+        for _ in range(nodes - 1):
+            job = Job(func=noop, dependencies=[job])
+    else:
+        job = Job(
+            func=noop, dependency_mode='graph',
+            dependencies=[Job(func=noop) for _ in range(nodes - 1)]
+        )
+    started = time.perf_counter()
+    job.run()
+    seconds = time.perf_counter() - started
+    return {
+        'benchmark': 'graph', 'shape': shape, 'jobs': nodes,
+        'seconds': seconds, 'jobs_per_second': nodes / seconds
+    }
+
+
+class BenchmarkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = 64 * 1024
+    body = json.dumps([{'name': f'user {i}'} for i in range(10)]).encode()
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def fetch_with_urlopen(url: str) -> Any:
+    with urlopen(url) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def bench_http(requests: int, concurrency: int,
+               client: str) -> dict[str, Any]:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BenchmarkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/users'
+    fetch = (
+        fetch_with_urlopen if client == 'urlopen'
+        else lambda target: http_request(target, response_format='json')
+    )
+    try:
+        with ThreadPoolExecutor(concurrency) as executor:
+            started = time.perf_counter()
+            list(executor.map(fetch, [url] * requests))
+            seconds = time.perf_counter() - started
+    finally:
+        default_pool().close()
+        server.shutdown()
+        server.server_close()
+    return {
+        'benchmark': 'http', 'client': client, 'requests': requests,
+        'concurrency': concurrency, 'seconds': seconds,
+        'requests_per_second': requests / seconds
+    }
+
+
+def bench_logging(events: int, handler_type: str,
+                  level: int) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as folder:
+        log_file = os.path.join(folder, 'bench.log')
+        logger = logging.getLogger(f'bench_{handler_type}')
+        logger.propagate = False
+        logger.setLevel(level)
+        if handler_type == 'file':
+            handler: logging.Handler = logging.FileHandler(log_file)
+            handler.setFormatter(
+                logging.Formatter('%(levelname)s %(asctime)s %(message)s')
+            )
+        else:
+            handler = QueuedFileHandler(log_file)
+        logger.addHandler(handler)
+        try:
+            started = time.perf_counter()
+            for i in range(events):
+                if handler_type == 'file':
+                    logger.info(f'Task {i}, function noop finished')
+                else:
+                    log_event(logger, logging.INFO, 'Job finished', uid=i,
+                              func='noop', attempt=1)
+            seconds = time.perf_counter() - started
+            writer.flush()
+            drained = time.perf_counter() - started
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+    return {
+        'benchmark': 'logging', 'handler': handler_type,
+        'level': logging.getLevelName(level), 'events': events,
+        'seconds': seconds, 'drained_seconds': drained,
+        'microseconds_per_event': seconds / events * 1e6
+    }
+
+
+def bench_profiling(jobs: int, mode: str) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as folder:
+        profiler = None
+        if mode != 'off':
+            profiler = Profiler(
+                folder, sample_rate=0.01 if mode == 'sampled' else 1.0,
+                cpu=mode != 'memory', memory=mode == 'memory'
+            )
+        batch = [Job(func=cpu_bound, profiler=profiler) for _ in range(jobs)]
+        started = time.perf_counter()
+        for job in batch:
+            job.run()
+        seconds = time.perf_counter() - started
+    return {
+        'benchmark': 'profiling', 'mode': mode, 'jobs': jobs,
+        'seconds': seconds, 'microseconds_per_job': seconds / jobs * 1e6
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except OSError:
+        return ''
+
+
+def scheduler_suite(args: argparse.Namespace) -> list[dict[str, Any]]:
+    results = []
+    for jobs in args.sizes:
+        for pool_size in args.pool_sizes:
+            results.append(bench_schedule(jobs, pool_size))
+            for store in ('file', 'sqlite'):
+                results.append(bench_schedule_many(jobs, pool_size, store))
+            for checkpointed in (False, True):
+                results.append(
+                    bench_recovery(jobs, pool_size, checkpointed)
+                )
+            for mode in args.modes:
+                for workload in args.workloads:
+                    results.append(
+                        bench_throughput(jobs, workload, mode, pool_size)
+                    )
+            for fair in (False, True):
+                results.append(bench_tenants(jobs, pool_size, fair))
+    return results
+
+
+def graph_suite(args: argparse.Namespace) -> list[dict[str, Any]]:
+    return [bench_graph(nodes, shape)
+            for nodes in args.graph_sizes for shape in ('deep', 'wide')]
+
+
+def http_suite(args: argparse.Namespace) -> list[dict[str, Any]]:
+    return [bench_http(requests, concurrency, client)
+            for requests in args.http_requests
+            for concurrency in args.http_concurrency
+            for client in HTTP_CLIENTS]
+
+
+def profiling_suite(args: argparse.Namespace) -> list[dict[str, Any]]:
+    return [bench_profiling(jobs, mode)
+            for jobs in args.sizes for mode in PROFILE_MODES]
+
+
+def logging_suite(args: argparse.Namespace) -> list[dict[str, Any]]:
+    return [bench_logging(events, handler_type, level)
+            for events in args.log_events
+            for handler_type in LOG_HANDLERS
+            for level in (logging.INFO, logging.WARNING)]
+
+
+SUITES = (scheduler_suite, graph_suite, http_suite, profiling_suite,
+          logging_suite)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Scheduler benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000])
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[10])
+    parser.add_argument('--modes', nargs='+', default=['sync', 'thread'],
+                        choices=EXECUTION_MODES)
+    parser.add_argument('--workloads', nargs='+', default=['noop', 'cpu'],
+                        choices=WORKLOADS)
+    parser.add_argument('--graph-sizes', type=int, nargs='+', default=[100])
+    parser.add_argument('--http-requests', type=int, nargs='+',
+                        default=[1000])
+    parser.add_argument('--http-concurrency', type=int, nargs='+',
+                        default=[1, 16])
+    parser.add_argument('--log-events', type=int, nargs='+',
+                        default=[100_000])
+    parser.add_argument('--output', help='JSON file for the results')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_arguments()
+    scheduler_logger.setLevel(logging.WARNING)
+    task_logger.setLevel(logging.WARNING)
+
+    results = []
+    for suite in SUITES:
+        results += suite(args)
+
+    report = json.dumps({
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'arguments': vars(args),
+        'results': results
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+from logs import log_event
+from utils import task_logger
+
+
+class ResultCache:
+    def __init__(self, folder: str | None = None, max_entries: int = 128,
+                 max_disk_bytes: int = 64 * 1024 * 1024) -> None:
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.disk: OrderedDict[str, int] = OrderedDict()
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if self.folder:
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+            self._scan_disk(self.folder)
+
+    @staticmethod
+    def key(func: Callable, args: list, kwargs: dict) -> str | None:
+        try:
+            payload = pickle.dumps((
+                func.__module__, func.__qualname__,
+                list(args), sorted(kwargs.items())
+            ))
+        except Exception:
+            return None
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[0] <= now:
+                del self.memory[key]
+                entry = None
+            if entry is not None:
+                self.memory.move_to_end(key)
+        if entry is None:
+            entry = self._read_disk(key, now)
+            if entry is not None:
+                self._remember(key, entry)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        log_event(task_logger, logging.INFO, 'Result cache hit', key=key)
+        return True, entry[1]
+
+    def put(self, key: str, value: Any, ttl: float) -> None:
+        entry = (time.time() + ttl, value)
+        self._remember(key, entry)
+        if self.folder:
+            self._write_disk(self.folder, key, entry)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.memory.clear()
+            self.disk.clear()
+            self.disk_bytes = 0
+        if self.folder:
+            for file in os.scandir(self.folder):
+                os.remove(file.path)
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'memory_entries': len(self.memory)
+            }
+
+    def _remember(self, key: str, entry: tuple[float, Any]) -> None:
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def _read_disk(self, key: str, now: float) -> tuple[float, Any] | None:
+        if not self.folder:
+            return None
+        file_name = os.path.join(self.folder, key)
+        try:
+            with open(file_name, 'rb') as file:
+                entry = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry[0] <= now:
+            self._forget_disk(key)
+            self._remove(file_name)
+            return None
+        os.utime(file_name)
+        with self.lock:
+            if key in self.disk:
+                self.disk.move_to_end(key)
+        return entry
+
+    def _write_disk(self, folder: str, key: str,
+                    entry: tuple[float, Any]) -> None:
+        file_name = os.path.join(folder, key)
+        tmp_file = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_file, 'wb') as file:
+                pickle.dump(entry, file)
+        except Exception as er:
+            self._remove(tmp_file)
+            log_event(task_logger, logging.WARNING,
+                      'Result is not cached on disk', key=key,
+                      error=str(er))
+            return
+        size = os.path.getsize(tmp_file)
+        os.replace(tmp_file, file_name)
+        with self.lock:
+            self.disk_bytes += size - self.disk.pop(key, 0)
+            self.disk[key] = size
+            evicted = []
+            while self.disk_bytes > self.max_disk_bytes:
+                old_key, old_size = self.disk.popitem(last=False)
+                self.disk_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._remove(os.path.join(folder, old_key))
+
+    def _scan_disk(self, folder: str) -> None:
+        files = []
+        for file in os.scandir(folder):
+            if file.name.endswith('.tmp'):
+                continue
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, file.name, stat.st_size))
+        for _, key, size in sorted(files):
+            self.disk[key] = size
+            self.disk_bytes += size
+
+    def _forget_disk(self, key: str) -> None:
+        with self.lock:
+            self.disk_bytes -= self.disk.pop(key, 0)
+
+    @staticmethod
+    def _remove(file_name: str) -> None:
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
+
+    def __getstate__(self) -> dict:
+        return {
+            'folder': self.folder, 'max_entries': self.max_entries,
+            'max_disk_bytes': self.max_disk_bytes
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        ResultCache.__init__(self, **state)
@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from queue import SimpleQueue
+from typing import Any
+
+from exceptions import ChannelException, StopExecution
+from job import Job
+from logs import log_event
+from serialization import dump_job
+from utils import scheduler_logger
+
+
+CHANNEL_ACTIONS = ('submit', 'cancel', 'query', 'metrics')
+
+
+class Command:
+    def __init__(self, action: str, payload: Any) -> None:
+        self.action = action
+        self.payload = payload
+        self.reply: Future = Future()
+
+
+class SchedulerServer:
+    def __init__(self, address: str, inbox: SimpleQueue,
+                 authkey: bytes | None = None) -> None:
+        self.address = address
+        self.inbox = inbox
+        self.authkey = authkey
+        self.listener: Listener | None = None
+        self.pending: set[Command] = set()
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(
+            self.address, family='AF_UNIX', authkey=self.authkey
+        )
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.listener is not None:
+                self.listener.close()
+                self.listener = None
+            for command in self.pending:
+                if not command.reply.done():
+                    command.reply.set_exception(
+                        StopExecution('Scheduler is stopping')
+                    )
+            self.pending.clear()
+
+    def _accept(self) -> None:
+        while self.listener is not None:
+            try:
+                connection = self.listener.accept()
+            except AuthenticationError:
+                continue
+            except (OSError, EOFError):
+                return
+            threading.Thread(
+                target=self._serve, args=(connection,), daemon=True
+            ).start()
+
+    def _serve(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    action, payload = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if action not in CHANNEL_ACTIONS:
+                    connection.send(('error', f'Unknown action "{action}"'))
+                    continue
+                command = Command(action, payload)
+                with self.lock:
+                    if self.listener is None:
+                        connection.send(('error', 'Scheduler is stopping'))
+                        return
+                    self.pending.add(command)
+                self.inbox.put(command)
+                try:
+                    connection.send(('ok', command.reply.result()))
+                except Exception as ex:
+                    log_event(scheduler_logger, logging.ERROR,
+                              'Channel command failed', action=action,
+                              error=str(ex))
+                    connection.send(('error', str(ex)))
+                finally:
+                    with self.lock:
+                        self.pending.discard(command)
+
+
+class SchedulerClient:
+    def __init__(self, address: str, authkey: bytes | None = None,
+                 connect_timeout: float = 5.0) -> None:
+        self.address = address
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self.connection: Connection | None = None
+        self.lock = threading.Lock()
+
+    def submit(self, job: Job) -> str:
+        return self.submit_many([job])[0]
+
+    def submit_many(self, jobs: list[Job]) -> list[str]:
+        return self._request('submit', [dump_job(job) for job in jobs])
+
+    def cancel(self, task_uid: str) -> bool:
+        return self._request('cancel', task_uid)
+
+    def query(self, task_uid: str) -> str | None:
+        return self._request('query', task_uid)
+
+    def metrics(self) -> dict[str, Any]:
+        return self._request('metrics', None)
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _request(self, action: str, payload: Any) -> Any:
+        with self.lock:
+            try:
+                status, result = self._exchange(action, payload)
+            except (OSError, EOFError):
+                self.close()
+                status, result = self._exchange(action, payload)
+        if status != 'ok':
+            raise ChannelException(result)
+        return result
+
+    def _exchange(self, action: str, payload: Any) -> tuple[str, Any]:
+        connection = self._connect()
+        try:
+            connection.send((action, payload))
+            return connection.recv()
+        except (OSError, EOFError):
+            self.close()
+            raise
+
+    def _connect(self) -> Connection:
+        if self.connection is not None:
+            return self.connection
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                self.connection = Client(
+                    self.address, family='AF_UNIX', authkey=self.authkey
+                )
+                return self.connection
+            except (FileNotFoundError, ConnectionRefusedError) as ex:
+                if time.monotonic() > deadline:
+                    raise ChannelException(
+                        f'Scheduler is not listening on {self.address}'
+                    ) from ex
+                time.sleep(0.01)
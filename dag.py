@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, TYPE_CHECKING
+from uuid import uuid4
+
+from exceptions import DependencyCycleException
+from handoff import ResultHandle, SharedResultStore
+
+if TYPE_CHECKING:
+    from job import Job
+
+
+def walk_dependencies(job: 'Job') -> list['Job']:
+    nodes: list['Job'] = []
+    visited: set[int] = set()
+    path: set[int] = set()
+
+    def visit(node: 'Job') -> None:
+        if id(node) in path:
+            raise DependencyCycleException(
+                f'Dependency cycle through {node.func.__name__}'
+            )
+        if id(node) in visited:
+            return
+        path.add(id(node))
+        for dependency in node.dependencies:
+            visit(dependency)
+        path.discard(id(node))
+        visited.add(id(node))
+        nodes.append(node)
+
+    for dependency in job.dependencies:
+        visit(dependency)
+    return nodes
+
+
+def assign_uids(job: 'Job') -> None:
+    for node in walk_dependencies(job):
+        if not node.uid:
+            node.uid = str(uuid4())
+
+
+def count_consumers(job: 'Job') -> dict[str, int]:
+    return Counter(
+        dependency.uid for node in [job, *walk_dependencies(job)]
+        for dependency in node.dependencies
+    )
+
+
+class DependencyResults:
+    def __init__(self, results: dict[str, Any], store: Any = None,
+                 task_uid: str = '',
+                 result_store: SharedResultStore | None = None,
+                 consumers: dict[str, int] | None = None) -> None:
+        self.results = results
+        self.store = store
+        self.task_uid = task_uid
+        self.result_store = result_store
+        self.consumers = consumers or {}
+        self.lock = threading.Lock()
+        self.pending: dict[str, Any] = {}
+
+    def run(self, job: 'Job') -> tuple[Any | None, int] | None:
+        with self.lock:
+            if job.uid in self.results:
+                return self.results[job.uid]
+            owner = job.uid not in self.pending
+            if owner:
+                self.pending[job.uid] = Future()
+            future = self.pending[job.uid]
+        if not owner:
+            return future.result()
+        job._memo = self
+        try:
+            result = self._complete(job, job.run())
+        except BaseException as ex:
+            with self.lock:
+                self.pending.pop(job.uid, None)
+            future.set_exception(ex)
+            raise
+        finally:
+            job._memo = None
+        future.set_result(result)
+        return result
+
+    async def run_async(self, job: 'Job') -> tuple[Any | None, int] | None:
+        if job.uid in self.results:
+            return self.results[job.uid]
+        task = self.pending.get(job.uid)
+        if task is None:
+            task = self.pending[job.uid] = asyncio.ensure_future(
+                self._run_node_async(job)
+            )
+        return await asyncio.shield(task)
+
+    async def _run_node_async(
+            self, job: 'Job') -> tuple[Any | None, int] | None:
+        job._memo = self
+        try:
+            result = await job.run_async()
+        finally:
+            job._memo = None
+        return self._complete(job, result)
+
+    def release_all(self) -> None:
+        if self.result_store is None:
+            return
+        for value, _ in list(self.results.values()):
+            if isinstance(value, ResultHandle):
+                value.unlink()
+
+    def _complete(self, job: 'Job', result: tuple[Any | None, int] | None
+                  ) -> tuple[Any | None, int] | None:
+        succeeded = result is not None and result[1] == 1
+        if succeeded and self.result_store is not None:
+            result = (self.result_store.offload(
+                result[0], self.consumers.get(job.uid, 1)  # type: ignore
+            ), 1)
+            for dependency in job.dependencies:
+                if dependency.uid in self.results:
+                    self.result_store.release(
+                        self.results[dependency.uid][0]
+                    )
+        with self.lock:
+            self.pending.pop(job.uid, None)
+            if not succeeded:
+                return result
+            self.results[job.uid] = result
+        if self.store is not None and self.task_uid:
+            self.store.record_dependency(self.task_uid, job.uid, result)
+        return result
@@ -0,0 +1,194 @@
+import ctypes
+import heapq
+import itertools
+import os
+import signal
+import threading
+import time
+
+from contextlib import AbstractContextManager, nullcontext
+from queue import Empty, SimpleQueue
+
+from exceptions import WorkingTimeoutException
+
+
+NO_DEADLINE = nullcontext()
+
+
+class DeadlineMonitor:
+    def __init__(self) -> None:
+        self.handler_installed = False
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self.requests: SimpleQueue = SimpleQueue()
+        self.heap: list[tuple[float, int]] = []
+        self.active: dict[int, int] = {}
+        self.busy: set[int] = set()
+        self.firing: set[int] = set()
+        self.interrupted: dict[int, int] = {}
+        self.pending: dict[int, int] = {}
+        self.counter = itertools.count()
+        self.start_lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+
+    def watch(self, seconds: float) -> int:
+        ident = threading.get_ident()
+        self._enter(ident)
+        try:
+            self._ensure_thread(ident)
+            token = next(self.counter)
+            self.active[token] = ident
+            if ident in self.pending:
+                del self.active[token]
+            else:
+                self.requests.put((time.monotonic() + seconds, token))
+        finally:
+            expired = self._leave(ident)
+        if expired is not None:
+            raise WorkingTimeoutException
+        return token
+
+    def cancel(self, token: int) -> bool:
+        ident = threading.get_ident()
+        self._enter(ident)
+        fired = self.active.pop(token, None) is None
+        expired = self._leave(ident)
+        if expired is not None and expired < token:
+            raise WorkingTimeoutException
+        return fired
+
+    def hold(self) -> None:
+        self._enter(threading.get_ident())
+
+    def release(self) -> None:
+        if self._leave(threading.get_ident()) is not None:
+            raise WorkingTimeoutException
+
+    def _enter(self, ident: int) -> None:
+        # The monitor never interrupts a busy thread, it leaves the timeout
+        # pending and the thread raises it in _leave. An interrupt sent just
+        # before this thread became busy is raised at its next eval-breaker
+        # check, which CPython runs after every call: sleeping until the
+        # monitor is done with the thread makes it land inside this try.
+        delivered = False
+        try:
+            self.busy.add(ident)
+            while ident in self.firing:
+                time.sleep(0)
+        except WorkingTimeoutException:
+            delivered = True
+        token = self.interrupted.pop(ident, None)
+        if token is not None and (
+                delivered or ident == threading.main_thread().ident):
+            self.pending.setdefault(ident, token)
+
+    def _leave(self, ident: int) -> int | None:
+        expired = None
+        try:
+            self.busy.discard(ident)
+            while ident in self.firing:
+                time.sleep(0)
+        except WorkingTimeoutException:
+            expired = self.interrupted.pop(ident, None)
+        return self.pending.pop(ident, expired)
+
+    def _ensure_thread(self, ident: int) -> None:
+        if ident == threading.main_thread().ident:
+            self._install_handler()
+        if self.thread is not None:
+            return
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            timeout = None
+            if self.heap:
+                timeout = max(self.heap[0][0] - time.monotonic(), 0)
+            try:
+                heapq.heappush(self.heap, self.requests.get(timeout=timeout))
+            except Empty:
+                pass
+            self._fire_due()
+
+    def _fire_due(self) -> None:
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            self._fire(heapq.heappop(self.heap)[1])
+        if len(self.heap) > 2 * len(self.active) + 64:
+            self.heap = [item for item in self.heap if item[1] in self.active]
+            heapq.heapify(self.heap)
+
+    def _fire(self, token: int) -> None:
+        ident = self.active.get(token)
+        if ident is None:
+            return
+        self.firing.add(ident)
+        try:
+            busy = ident in self.busy
+            if busy:
+                self.pending.setdefault(ident, token)
+            else:
+                self.interrupted[ident] = token
+            for other, owner in list(self.active.items()):
+                if owner == ident and other >= token:
+                    self.active.pop(other, None)
+            if not busy:
+                self._interrupt(ident)
+        finally:
+            self.firing.discard(ident)
+
+    @staticmethod
+    def _interrupt(ident: int) -> None:
+        if ident == threading.main_thread().ident:
+            signal.pthread_kill(ident, signal.SIGALRM)
+        else:
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                ctypes.c_ulong(ident),
+                ctypes.py_object(WorkingTimeoutException)
+            )
+
+    def _install_handler(self) -> None:
+        if not self.handler_installed:
+            signal.signal(signal.SIGALRM, self._handle_alarm)
+            self.handler_installed = True
+
+    def _handle_alarm(self, signum, frame) -> None:
+        ident = threading.get_ident()
+        if ident in self.busy:
+            return
+        if self.interrupted.pop(ident, None) is not None:
+            raise WorkingTimeoutException
+
+
+monitor = DeadlineMonitor()
+
+
+class Deadline:
+    def __init__(self, seconds: float) -> None:
+        self.expires = time.monotonic() + seconds
+        self.token = -1
+
+    def __enter__(self) -> None:
+        self.token = monitor.watch(self.expires - time.monotonic())
+
+    def __exit__(self, *exc_info) -> None:
+        monitor.cancel(self.token)
+
+
+class Shield:
+    def __enter__(self) -> None:
+        monitor.hold()
+
+    def __exit__(self, *exc_info) -> None:
+        monitor.release()
+
+
+def deadline(seconds: float) -> AbstractContextManager:
+    if seconds <= 0:
+        return NO_DEADLINE
+    return Deadline(seconds)
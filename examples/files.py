@@ -1,5 +1,7 @@
 import time
 
+from collections.abc import Iterable, Iterator
+
 
 def read_file(path: str) -> list[str]:
     with open(path, 'r') as file:
@@ -13,7 +15,17 @@ def update_data(data: list[str]) -> list[str]:
     return result
 
 
-def write_to_file(path: str, data: list[str]) -> None:
+def read_lines(path: str) -> Iterator[str]:
+    with open(path, 'r') as file:
+        yield from file
+
+
+def update_lines(data: Iterable[str]) -> Iterator[str]:
+    for line in data:
+        yield line.replace('o', '_').upper()
+
+
+def write_to_file(path: str, data: Iterable[str]) -> None:
     with open(path, 'w') as file:
         file.writelines(data)
 
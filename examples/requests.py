@@ -1,11 +1,16 @@
+import asyncio
 import json
 
+from urllib.parse import urlsplit
 from urllib.request import urlopen, Request
 from http import HTTPStatus
 
 
+users_url = 'https://jsonplaceholder.typicode.com/users'
+
+
 def get_data() -> list[dict]:
-    url = 'https://jsonplaceholder.typicode.com/users'
+    url = users_url
     with urlopen(url) as response:
         if response.status != HTTPStatus.OK:
             raise Exception(
@@ -18,6 +23,32 @@ def get_data() -> list[dict]:
         return data
 
 
+async def get_data_async(url: str = users_url) -> list[dict]:
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or (443 if secure else 80),
+        ssl=secure or None
+    )
+    try:
+        writer.write(
+            f'GET {path} HTTP/1.0\r\nHost: {parts.hostname}\r\n'
+            f'Accept: application/json\r\n\r\n'.encode()
+        )
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    _, status, reason = head.split(b'\r\n', 1)[0].decode().split(' ', 2)
+    if int(status) != HTTPStatus.OK:
+        raise Exception(
+            "Error during execute request. {}: {}".format(status, reason)
+        )
+    return json.loads(body.decode("utf-8"))
+
+
 def get_user_names(users: list[dict]) -> list[str]:
     user_names = [user['name'] + '\n' for user in users]
     return user_names
@@ -12,3 +12,19 @@ class StopExecution(Exception):
 
 class RunDateTimeException(Exception):
     pass
+
+
+class DependencyCycleException(Exception):
+    pass
+
+
+class ChannelException(Exception):
+    pass
+
+
+class HttpStatusException(Exception):
+    pass
+
+
+class TenantBacklogException(Exception):
+    pass
@@ -0,0 +1,79 @@
+import asyncio
+import multiprocessing
+import threading
+
+from concurrent.futures import (
+    Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+)
+from concurrent.futures import wait as wait_futures
+from collections.abc import Callable
+from typing import Any
+
+from job import Job
+
+
+EXECUTION_MODES = ('sync', 'thread', 'process', 'asyncio')
+
+
+def run_job(job: Job) -> tuple[tuple[Any | None, int] | None, Job]:
+    return job.run(defer_retries=True), job
+
+
+async def run_job_async(
+        job: Job) -> tuple[tuple[Any | None, int] | None, Job]:
+    return await job.run_async(defer_retries=True), job
+
+
+class InlineExecutor(Executor):
+    def submit(self, fn, /, *args, **kwargs) -> Future:  # type: ignore
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as ex:
+            future.set_exception(ex)
+        return future
+
+
+class AsyncioExecutor(Executor):
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, daemon=True
+        )
+        self.thread.start()
+        self.futures: set[Future] = set()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:  # type: ignore
+        future = asyncio.run_coroutine_threadsafe(
+            fn(*args, **kwargs), self.loop
+        )
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    def shutdown(self, wait: bool = True, *,
+                 cancel_futures: bool = False) -> None:
+        if wait:
+            wait_futures(list(self.futures))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def create_executor(mode: str, pool_size: int) -> Executor:
+    if mode == 'thread':
+        return ThreadPoolExecutor(max_workers=pool_size)
+    if mode == 'process':
+        return ProcessPoolExecutor(
+            max_workers=pool_size,
+            mp_context=multiprocessing.get_context('forkserver')
+        )
+    if mode == 'asyncio':
+        return AsyncioExecutor()
+    return InlineExecutor()
+
+
+def job_runner(mode: str) -> Callable:
+    if mode == 'asyncio':
+        return run_job_async
+    return run_job
@@ -0,0 +1,88 @@
+import fcntl
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+from typing import Any
+from uuid import uuid4
+
+
+HANDOFF_THRESHOLD = 1024 * 1024
+HANDOFF_FOLDER = (
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+)
+REFCOUNT = struct.Struct('<q')
+
+
+class ResultHandle:
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f'ResultHandle({self.path!r}, {self.size})'
+
+    def load(self) -> Any:
+        with open(self.path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    with view[REFCOUNT.size:] as payload:
+                        return pickle.loads(payload)
+
+    def release(self) -> bool:
+        try:
+            file = open(self.path, 'r+b')
+        except FileNotFoundError:
+            return True
+        with file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            count = REFCOUNT.unpack(file.read(REFCOUNT.size))[0] - 1
+            if count > 0:
+                file.seek(0)
+                file.write(REFCOUNT.pack(count))
+                return False
+            self.unlink()
+            return True
+
+    def unlink(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SharedResultStore:
+    def __init__(self, threshold: int = HANDOFF_THRESHOLD,
+                 folder: str = HANDOFF_FOLDER) -> None:
+        self.threshold = threshold
+        self.folder = folder
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    def offload(self, value: Any, consumers: int = 1) -> Any:
+        if value is None or isinstance(value, (ResultHandle, int, float)):
+            return value
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return value
+        if len(data) < self.threshold:
+            return value
+        path = os.path.join(self.folder, f'result-{uuid4().hex}')
+        with open(path, 'wb') as file:
+            file.write(REFCOUNT.pack(max(consumers, 1)))
+            file.write(data)
+        return ResultHandle(path, len(data))
+
+    @staticmethod
+    def resolve(value: Any) -> Any:
+        if isinstance(value, ResultHandle):
+            return value.load()
+        return value
+
+    @staticmethod
+    def release(value: Any) -> None:
+        if isinstance(value, ResultHandle):
+            value.release()
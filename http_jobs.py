@@ -0,0 +1,177 @@
+import http.client
+import json
+import os
+import threading
+
+from typing import Any
+from urllib.parse import urlsplit
+
+from exceptions import HttpStatusException
+from job import Job
+
+
+RESPONSE_FORMATS = ('bytes', 'text', 'json')
+DEFAULT_TIMEOUT = 30.0
+MAX_PER_HOST = 8
+MAX_IN_FLIGHT = 64
+STREAM_CHUNK_SIZE = 64 * 1024
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError
+)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE')
+
+
+class ConnectionPool:
+    def __init__(self, max_per_host: int = MAX_PER_HOST,
+                 max_in_flight: int = MAX_IN_FLIGHT) -> None:
+        self.max_per_host = max_per_host
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.hosts: dict[tuple, tuple[threading.Semaphore, list]] = {}
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def request(self, method: str, url: str, body: bytes | None = None,
+                headers: dict[str, str] | None = None,
+                stream_to: str | None = None,
+                timeout: float = DEFAULT_TIMEOUT
+                ) -> tuple[int, str, bytes | str]:
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        replay = method.upper() in IDEMPOTENT_METHODS
+        limit, idle = self._host(key)
+        with limit, self.in_flight:
+            for attempt in range(2):
+                connection, reused = self._checkout(key, idle, timeout)
+                try:
+                    connection.request(method, path, body, headers or {})
+                    response = connection.getresponse()
+                    status_ok = 200 <= response.status < 300
+                    data = self._read(
+                        response, stream_to if status_ok else None
+                    )
+                except STALE_CONNECTION_ERRORS:
+                    connection.close()
+                    if replay and reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    connection.close()
+                    raise
+                if response.will_close:
+                    connection.close()
+                else:
+                    with self.lock:
+                        idle.append(connection)
+                return response.status, response.reason, data
+        raise http.client.HTTPException(f'Cannot reach {url}')
+
+    def close(self) -> None:
+        with self.lock:
+            for _, idle in self.hosts.values():
+                while idle:
+                    idle.pop().close()
+
+    def _host(self, key: tuple) -> tuple[threading.Semaphore, list]:
+        with self.lock:
+            if key not in self.hosts:
+                self.hosts[key] = (
+                    threading.Semaphore(self.max_per_host), []
+                )
+            return self.hosts[key]
+
+    def _checkout(self, key: tuple, idle: list, timeout: float
+                  ) -> tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            connection = idle.pop() if idle else None
+        if connection is not None:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return connection, True
+        scheme, host, port = key
+        connection_class = (
+            http.client.HTTPSConnection if scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        with self.lock:
+            self.created += 1
+        return connection_class(host, port, timeout=timeout), False
+
+    @staticmethod
+    def _read(response: http.client.HTTPResponse,
+              stream_to: str | None) -> bytes | str:
+        if stream_to is None:
+            return response.read()
+        tmp_file = stream_to + '.part'
+        try:
+            with open(tmp_file, 'wb') as file:
+                while chunk := response.read(STREAM_CHUNK_SIZE):
+                    file.write(chunk)
+            os.replace(tmp_file, stream_to)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        return stream_to
+
+
+_pools: dict[int, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def default_pool() -> ConnectionPool:
+    pid = os.getpid()
+    with _pools_lock:
+        if pid not in _pools:
+            _pools.clear()
+            _pools[pid] = ConnectionPool()
+        return _pools[pid]
+
+
+def http_request(url: str, method: str = 'GET', body: Any = None,
+                 headers: dict[str, str] | None = None,
+                 json_body: Any = None, stream_to: str | None = None,
+                 response_format: str = 'bytes',
+                 timeout: float = DEFAULT_TIMEOUT) -> Any:
+    headers = dict(headers or {})
+    if json_body is not None:
+        body = json.dumps(json_body).encode()
+        headers.setdefault('Content-Type', 'application/json')
+    elif isinstance(body, str):
+        body = body.encode()
+    status, reason, data = default_pool().request(
+        method, url, body, headers, stream_to, timeout
+    )
+    if not 200 <= status < 300:
+        raise HttpStatusException(f'{method} {url} failed: {status} {reason}')
+    if stream_to is not None or response_format == 'bytes':
+        return data
+    text = data.decode('utf-8')  # type: ignore
+    return json.loads(text) if response_format == 'json' else text
+
+
+class HttpJob(Job):
+    def __init__(self, url: str, method: str = 'GET', body: Any = None,
+                 headers: dict[str, str] | None = None,
+                 json_body: Any = None, stream_to: str | None = None,
+                 response_format: str = 'bytes',
+                 timeout: float = DEFAULT_TIMEOUT, **options: Any) -> None:
+        if response_format not in RESPONSE_FORMATS:
+            raise ValueError(
+                f'Unknown response format "{response_format}", '
+                f'expected one of {RESPONSE_FORMATS}'
+            )
+        resources = [
+            *(options.pop('resources', None) or []),
+            f'host:{urlsplit(url).netloc}'
+        ]
+        super().__init__(
+            func=http_request,
+            kwargs={
+                'url': url, 'method': method, 'body': body,
+                'headers': headers, 'json_body': json_body,
+                'stream_to': stream_to, 'response_format': response_format,
+                'timeout': timeout
+            },
+            resources=resources, **options
+        )
@@ -1,92 +1,340 @@
-import signal
+import asyncio
+import logging
+import time
 
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager
 from typing import Any
 from collections.abc import Callable
 
 from exceptions import (
     WorkingTimeoutException, RunDateTimeException, TaskErrorException
 )
-from utils import handler_alarm, task_logger
+from cache import ResultCache
+from dag import DependencyResults, assign_uids, count_consumers
+from deadlines import NO_DEADLINE, deadline
+from handoff import ResultHandle, SharedResultStore
+from logs import log_event
+from pipeline import BoundedStream, open_stream
+from profiling import NO_PROFILE, Profiler
+from retry import RetryPolicy
+from schedules import Schedule
+from utils import task_logger, parse_start_at
 
 
-signal.signal(signal.SIGALRM, handler_alarm)
+DEPENDENCY_MODES = ('chain', 'graph', 'stream')
 
 
 class Job:
     def __init__(
             self, func: Callable, args: list | None = None,
             kwargs: dict | None = None, start_at: str = '',
-            max_working_time: int = 0, tries: int = 1,
+            max_working_time: float = 0, tries: int = 1,
             dependencies: list['Job'] | None = None,
-            return_arg: str | None = None
+            return_arg: str | None = None, priority: int = 0,
+            dependency_mode: str = 'chain', cache_ttl: float = 0,
+            result_cache: ResultCache | None = None,
+            retry_policy: RetryPolicy | None = None,
+            schedule: Schedule | None = None,
+            result_store: SharedResultStore | None = None,
+            resources: list[str] | None = None, tenant: str = '',
+            profiler: Profiler | None = None
     ) -> None:
+        if dependency_mode not in DEPENDENCY_MODES:
+            raise ValueError(
+                f'Unknown dependency mode "{dependency_mode}", '
+                f'expected one of {DEPENDENCY_MODES}'
+            )
+        if ';' in tenant or '\n' in tenant:
+            raise ValueError(f'Invalid tenant name "{tenant}"')
         self.func = func
         self.args = args or []
         self.kwargs = kwargs or {}
         self.start_at = start_at
+        self.start_ts = parse_start_at(start_at)
         self.max_working_time = max_working_time
         self.tries = tries
         self.dependencies = dependencies or []
         self.return_arg = return_arg
+        self.priority = priority
+        self.dependency_mode = dependency_mode
+        self.cache_ttl = cache_ttl
+        self.result_cache = result_cache
+        self.retry_policy = retry_policy
+        self.schedule = schedule
+        self.result_store = result_store
+        self.resources = resources or []
+        self.tenant = tenant
+        self.profiler = profiler
+        self.attempts = 0
+        self.run_attempts = 0
+        self.retry_delay = 0.0
+        self.last_error = ''
+        self.completed_dependencies: dict[str, Any] = {}
+        self.dependency_store: Any = None
         self.uid = ''
+        self._memo: DependencyResults | None = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_memo'] = None
+        return state
+
+    def run(self, defer_retries: bool = False
+            ) -> tuple[Any | None, int] | None:
+        if not self._check_start_time():
+            return None, 0
+        memo = self._dependency_memo()
+        self.last_error = ''
+        self.run_attempts = 0
+        while True:
+            self.attempts += 1
+            self.run_attempts += 1
+            started = time.perf_counter()
+            try:
+                limit = deadline(self._sync_deadline())
+                with limit:
+                    if self.dependencies:
+                        self.kwargs.update(**self._run_dependencies(memo))
+                result = self._call(limit)
+                self._log(logging.INFO, 'Job finished', started)
+                return self._finish(result, 1, memo)
+            except Exception as er:
+                self._handle_error(er, started)
+                delay = self._next_retry(er)
+            finally:
+                self._close_streams()
+            if delay is None:
+                return self._finish(None, memo=memo)
+            if delay and defer_retries:
+                return delay, 2
+            time.sleep(delay)
 
-    def run(self) -> tuple[Any | None, int] | None:
+    async def run_async(self, defer_retries: bool = False
+                        ) -> tuple[Any | None, int] | None:
         if not self._check_start_time():
             return None, 0
-        for _ in range(self.tries):
+        memo = self._dependency_memo()
+        self.last_error = ''
+        self.run_attempts = 0
+        while True:
+            self.attempts += 1
+            self.run_attempts += 1
+            started = time.perf_counter()
             try:
-                self.stop()
                 if self.dependencies:
-                    self.kwargs.update(**self._run_dependencies())
-                result = self.func(*self.args, **self.kwargs)
-                task_logger.info(
-                    f'Task {self.uid}, function {self.func.__name__} finished'
-                )
-                return result, 1
-            except WorkingTimeoutException:
-                task_logger.warning(
-                    f'{self.func.__name__}: Execution time exceeded'
-                )
-            except RunDateTimeException:
-                task_logger.info('One of the dependencies cannot be run yet')
-            except TaskErrorException as er:
-                task_logger.error(str(er))
+                    self.kwargs.update(
+                        **await self._run_dependencies_async(memo)
+                    )
+                result = await self._call_async()
+                self._log(logging.INFO, 'Job finished', started)
+                return self._finish(result, 1, memo)
+            except asyncio.TimeoutError:
+                er = WorkingTimeoutException()
+                self._handle_error(er, started)
+                delay = self._next_retry(er)
             except Exception as er:
-                task_logger.error(
-                    f'Task "{self.uid}" function "{self.func.__name__}" '
-                    f'raised an exception: {er}'
-                )
+                self._handle_error(er, started)
+                delay = self._next_retry(er)
             finally:
-                signal.alarm(0)
-        return None
+                self._close_streams()
+            if delay is None:
+                return self._finish(None, memo=memo)
+            if delay and defer_retries:
+                return delay, 2
+            await asyncio.sleep(delay)
+
+    def reset_dependencies(self) -> None:
+        self.completed_dependencies = {}
+
+    def is_coroutine(self) -> bool:
+        return asyncio.iscoroutinefunction(self.func)
 
-    def stop(self) -> None:
+    def _call(self, limit: AbstractContextManager = NO_DEADLINE) -> Any:
+        key = self._cache_key()
+        if key and self.result_cache is not None:
+            hit, result = self.result_cache.get(key)
+            if hit:
+                return result
+        with self._profile(), limit:
+            if self.is_coroutine():
+                result = asyncio.run(self._execute_async())
+            else:
+                result = self.func(*self.args, **self._call_kwargs())
+        if key and self.result_cache is not None:
+            self.result_cache.put(key, result, self.cache_ttl)
+        return result
+
+    async def _call_async(self) -> Any:
+        key = self._cache_key()
+        if key and self.result_cache is not None:
+            hit, result = self.result_cache.get(key)
+            if hit:
+                return result
+        result = await self._execute_async()
+        if key and self.result_cache is not None:
+            self.result_cache.put(key, result, self.cache_ttl)
+        return result
+
+    async def _execute_async(self) -> Any:
+        if self.is_coroutine():
+            call = self.func(*self.args, **self._call_kwargs())
+        else:
+            call = asyncio.to_thread(self._call_with_deadline)
         if self.max_working_time > 0:
-            signal.alarm(self.max_working_time)
+            return await asyncio.wait_for(call, self.max_working_time)
+        return await call
+
+    def _next_retry(self, er: Exception) -> float | None:
+        if self.attempts >= self.tries:
+            return None
+        if self.retry_policy is None:
+            return 0.0
+        if not self.retry_policy.should_retry(er):
+            return None
+        self.retry_delay = self.retry_policy.next_delay(
+            self.attempts, self.retry_delay
+        )
+        self._log(logging.INFO, 'Job retry scheduled',
+                  delay=round(self.retry_delay, 3))
+        return self.retry_delay
+
+    def _finish(self, result: Any, code: int | None = None,
+                memo: DependencyResults | None = None
+                ) -> tuple[Any | None, int] | None:
+        if memo is not None and self._memo is None:
+            memo.release_all()
+        self.attempts = 0
+        self.retry_delay = 0.0
+        return None if code is None else (result, code)
+
+    def _call_kwargs(self) -> dict:
+        if not any(isinstance(value, ResultHandle)
+                   for value in self.kwargs.values()):
+            return self.kwargs
+        return {
+            key: SharedResultStore.resolve(value)
+            for key, value in self.kwargs.items()
+        }
+
+    def _cache_key(self) -> str | None:
+        if self.cache_ttl <= 0 or self.result_cache is None:
+            return None
+        return self.result_cache.key(self.func, self.args, self.kwargs)
+
+    def _handle_error(self, er: Exception, started: float = 0.0) -> None:
+        self.last_error = type(er).__name__
+        if isinstance(er, WorkingTimeoutException):
+            self._log(logging.WARNING, 'Execution time exceeded', started)
+        elif isinstance(er, RunDateTimeException):
+            self._log(logging.INFO, 'One of the dependencies cannot be run '
+                      'yet', started)
+        elif isinstance(er, TaskErrorException):
+            self._log(logging.ERROR, str(er), started)
+        else:
+            self._log(logging.ERROR, 'Job raised an exception', started,
+                      error=f'{self.last_error}: {er}')
+
+    def _log(self, level: int, message: str, started: float = 0.0,
+             **fields: Any) -> None:
+        if not task_logger.isEnabledFor(level):
+            return
+        if started:
+            fields['duration'] = round(time.perf_counter() - started, 6)
+        log_event(task_logger, level, message, uid=self.uid,
+                  func=self.func.__name__, attempt=self.attempts, **fields)
+
+    def _sync_deadline(self) -> float:
+        return 0 if self.is_coroutine() else self.max_working_time
+
+    def _call_with_deadline(self) -> Any:
+        with self._profile(), deadline(self.max_working_time):
+            return self.func(*self.args, **self._call_kwargs())
+
+    def _profile(self) -> AbstractContextManager:
+        if self.profiler is None or not self.profiler.sampled():
+            return NO_PROFILE
+        return self.profiler.profile(self.func.__name__)
 
     def _check_start_time(self) -> bool:
-        if self.start_at:
-            datetime_object = datetime.strptime(
-                self.start_at, '%d-%m-%Y %H:%M:%S'
+        return time.time() > self.start_ts
+
+    def _dependency_memo(self) -> DependencyResults:
+        if self._memo is not None:
+            return self._memo
+        assign_uids(self)
+        return DependencyResults(
+            self.completed_dependencies, self.dependency_store, self.uid,
+            self.result_store,
+            count_consumers(self) if self.result_store else None
+        )
+
+    def _run_dependencies(self, memo: DependencyResults) -> dict:
+        results: dict = {}
+        if self.dependency_mode == 'stream':
+            return self._stream_dependencies()
+        if self.dependency_mode == 'graph':
+            pool = ThreadPoolExecutor(len(self.dependencies))
+            try:
+                outcomes = list(pool.map(memo.run, self.dependencies))
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+            for job, outcome in zip(self.dependencies, outcomes):
+                results.update(self._dependency_results(job, outcome))
+            return results
+        for job in self.dependencies:
+            job.kwargs.update(**results)
+            results = self._dependency_results(job, memo.run(job))
+        return results
+
+    async def _run_dependencies_async(
+            self, memo: DependencyResults) -> dict:
+        results: dict = {}
+        if self.dependency_mode == 'stream':
+            return await asyncio.to_thread(self._stream_dependencies)
+        if self.dependency_mode == 'graph':
+            outcomes = await asyncio.gather(
+                *(memo.run_async(job) for job in self.dependencies)
             )
-            return datetime.now() > datetime_object
-        return True
+            for job, outcome in zip(self.dependencies, outcomes):
+                results.update(self._dependency_results(job, outcome))
+            return results
+        for job in self.dependencies:
+            job.kwargs.update(**results)
+            results = self._dependency_results(
+                job, await memo.run_async(job)
+            )
+        return results
 
-    def _run_dependencies(self) -> dict:
+    def _stream_dependencies(self) -> dict:
         results: dict = {}
-        for i, job in enumerate(self.dependencies):
+        for job in self.dependencies:
             job.kwargs.update(**results)
-            result = job.run()
-            if result is None:
-                raise TaskErrorException(
-                    f'Dependence task {job.uid} {job.func.__name__} '
-                    f'raised an exception'
-                )
-            elif result[1] == 0:
-                raise RunDateTimeException
-            elif result[1] == 1 and job.return_arg:
-                results = {job.return_arg: result[0]}
-            else:
-                results = {}
+            results = {
+                key: open_stream(value) for key, value in
+                self._dependency_results(job, job.run()).items()
+            }
         return results
+
+    def _close_streams(self) -> None:
+        if self.dependency_mode != 'stream':
+            return
+        for node in [*self.dependencies, self]:
+            for key, value in list(node.kwargs.items()):
+                if isinstance(value, BoundedStream):
+                    value.close()
+                    del node.kwargs[key]
+
+    @staticmethod
+    def _dependency_results(
+            job: 'Job', result: tuple[Any | None, int] | None) -> dict:
+        if result is None:
+            raise TaskErrorException(
+                f'Dependence task {job.uid} {job.func.__name__} '
+                f'raised an exception'
+            )
+        elif result[1] == 0:
+            raise RunDateTimeException
+        elif result[1] == 1 and job.return_arg:
+            return {job.return_arg: result[0]}
+        return {}
@@ -0,0 +1,89 @@
+import math
+
+from collections import deque
+from typing import Any
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 0) -> None:
+        if rate <= 0:
+            raise ValueError('Token bucket rate must be positive')
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self.tokens = float(self.burst)
+        self.updated = 0.0
+
+    def available(self, now: float) -> int:
+        self._refill(now)
+        return int(self.tokens)
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def next_token_at(self, now: float) -> float:
+        self._refill(now)
+        return now + max(1 - self.tokens, 0) / self.rate
+
+    def _refill(self, now: float) -> None:
+        if self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+
+class ResourceLimiter:
+    def __init__(self, limits: dict[str, int] | None = None,
+                 rates: dict[str, float] | None = None) -> None:
+        self.limits = dict(limits or {})
+        self.buckets = {
+            name: TokenBucket(rate) for name, rate in (rates or {}).items()
+        }
+        self.in_use: dict[str, int] = {}
+        self.parked: dict[str, deque] = {}
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self.parked.values())
+
+    def acquire(self, resources: list[str], now: float) -> str | None:
+        for name in resources:
+            if self._free_slots(name, now) < 1:
+                return name
+        for name in resources:
+            if name in self.limits:
+                self.in_use[name] = self.in_use.get(name, 0) + 1
+            if name in self.buckets:
+                self.buckets[name].consume(now)
+        return None
+
+    def release(self, resources: list[str]) -> None:
+        for name in resources:
+            if self.in_use.get(name):
+                self.in_use[name] -= 1
+
+    def park(self, name: str, item: Any) -> None:
+        self.parked.setdefault(name, deque()).append(item)
+
+    def unpark(self, now: float) -> list[Any]:
+        items = []
+        for name, parked in self.parked.items():
+            free = min(self._free_slots(name, now), len(parked))
+            for _ in range(int(free)):
+                items.append(parked.popleft())
+        return items
+
+    def next_wake(self, now: float) -> float | None:
+        wake_at = [
+            self.buckets[name].next_token_at(now)
+            for name, parked in self.parked.items()
+            if parked and name in self.buckets
+            and self.limits.get(name, math.inf) > self.in_use.get(name, 0)
+        ]
+        return min(wake_at) if wake_at else None
+
+    def _free_slots(self, name: str, now: float) -> float:
+        free = self.limits.get(name, math.inf) - self.in_use.get(name, 0)
+        if name in self.buckets:
+            free = min(free, self.buckets[name].available(now))
+        return free
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import threading
+
+from multiprocessing.util import Finalize
+from queue import Empty, SimpleQueue
+from typing import Any
+
+
+LOG_BATCH_SIZE = 512
+ENCODER = json.JSONEncoder(default=str)
+_FLUSH = object()
+_STOP = object()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        event.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            event['exc'] = self.formatException(record.exc_info)
+        return ENCODER.encode(event)
+
+
+class BatchWriter:
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        self.formatter = JsonLinesFormatter()
+        self.queue: SimpleQueue = SimpleQueue()
+        self.files: dict[str, Any] = {}
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+        self.pid = 0
+
+    def submit(self, path: str, record: logging.LogRecord) -> None:
+        if self.pid != os.getpid():
+            self._start()
+        self.queue.put((path, record))
+
+    def flush(self, timeout: float = 5.0) -> None:
+        if self.pid != os.getpid() or self.thread is None:
+            return
+        done = threading.Event()
+        self.queue.put((_FLUSH, done))
+        done.wait(timeout)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self.pid != os.getpid() or self.thread is None:
+            return
+        self.queue.put((_STOP, None))
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _start(self) -> None:
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = SimpleQueue()
+            self.files = {}
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+            Finalize(self, self.stop, exitpriority=100)
+
+    def _run(self) -> None:
+        while not self._write_batch(self._take_batch()):
+            pass
+        for file in self.files.values():
+            file.close()
+
+    def _take_batch(self) -> list[tuple[Any, Any]]:
+        batch = [self.queue.get()]
+        try:
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except Empty:
+            pass
+        return batch
+
+    def _write_batch(self, batch: list[tuple[Any, Any]]) -> bool:
+        lines: dict[str, list[str]] = {}
+        waiters, stop = [], False
+        for path, record in batch:
+            if path is _FLUSH:
+                waiters.append(record)
+            elif path is _STOP:
+                stop = True
+            else:
+                lines.setdefault(path, []).append(self._format(record) + '\n')
+        for path, chunk in lines.items():
+            self._write(path, ''.join(chunk))
+        for waiter in waiters:
+            waiter.set()
+        return stop
+
+    def _format(self, record: logging.LogRecord) -> str:
+        try:
+            return self.formatter.format(record)
+        except Exception as ex:
+            return json.dumps({'level': 'ERROR', 'message': str(ex)})
+
+    def _write(self, path: str, text: str) -> None:
+        file = self.files.get(path)
+        if file is None:
+            file = self.files[path] = open(path, 'a', encoding='utf-8')
+        file.write(text)
+        file.flush()
+
+
+writer = BatchWriter()
+
+
+class QueuedFileHandler(logging.Handler):
+    def __init__(self, log_file: str) -> None:
+        super().__init__()
+        self.path = os.path.abspath(log_file)
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        if self.filters and not self.filter(record):
+            return False
+        writer.submit(self.path, record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        writer.submit(self.path, record)
+
+
+def log_event(logger: logging.Logger, level: int, message: str,
+              **fields: Any) -> None:
+    if logger.isEnabledFor(level):
+        record = logger.makeRecord(
+            logger.name, level, '', 0, message, (), None,
+            extra={'fields': fields}
+        )
+        logger.handle(record)
@@ -55,20 +55,21 @@ error_task = Job(
 )
 
 files_depend_1 = Job(
-    func=files.read_file,
+    func=files.read_lines,
     kwargs={
         'path': file_system.test_directory + file_system.test_file_name,
     },
     return_arg='data'
 )
 files_depend_2 = Job(
-    func=files.update_data,
+    func=files.update_lines,
     return_arg='data'
 )
 files_task = Job(
     func=files.write_to_file,
     args=[file_system.test_directory + 'updated_file.txt'],
-    dependencies=[files_depend_1, files_depend_2]
+    dependencies=[files_depend_1, files_depend_2],
+    dependency_mode='stream'
 )
 
 infinity_task = Job(
@@ -0,0 +1,145 @@
+import bisect
+import json
+import os
+import threading
+
+from typing import Any
+
+
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0
+)
+METRICS_FORMATS = ('json', 'prometheus')
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            'count': self.count, 'sum': self.sum,
+            'p50': self.quantile(0.5), 'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99)
+        }
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.counters: dict[tuple[str, str], int] = {}
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.gauges: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def increment(self, event: str, func_name: str, value: int = 1) -> None:
+        with self.lock:
+            key = (event, func_name)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, func_name: str, value: float) -> None:
+        with self.lock:
+            key = (name, func_name)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(max(value, 0.0))
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    def counter(self, event: str, func_name: str | None = None) -> int:
+        with self.lock:
+            return sum(
+                value for (name, func), value in self.counters.items()
+                if name == event and func_name in (None, func)
+            )
+
+    def histogram(self, name: str, func_name: str) -> Histogram | None:
+        return self.histograms.get((name, func_name))
+
+    def snapshot(self) -> dict[str, Any]:
+        with self.lock:
+            functions: dict[str, dict[str, Any]] = {}
+            for (event, func_name), value in self.counters.items():
+                functions.setdefault(func_name, {})[event] = value
+            for (name, func_name), histogram in self.histograms.items():
+                functions.setdefault(func_name, {})[name] = (
+                    histogram.snapshot()
+                )
+            return {'functions': functions, 'gauges': dict(self.gauges)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        lines = ['# TYPE scheduler_tasks_total counter']
+        with self.lock:
+            for (event, func_name), value in sorted(self.counters.items()):
+                lines.append(
+                    f'scheduler_tasks_total{{event="{event}",'
+                    f'func="{func_name}"}} {value}'
+                )
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE scheduler_{name} histogram')
+                for (metric, func_name), histogram in sorted(
+                        self.histograms.items(), key=lambda item: item[0]):
+                    if metric == name:
+                        lines.extend(
+                            self._histogram_lines(name, func_name, histogram)
+                        )
+            for name, gauge in sorted(self.gauges.items()):
+                lines.append(f'# TYPE scheduler_{name} gauge')
+                lines.append(f'scheduler_{name} {gauge}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, file_name: str, metrics_format: str = 'json') -> None:
+        content = (
+            self.to_prometheus() if metrics_format == 'prometheus'
+            else self.to_json()
+        )
+        tmp_file = file_name + '.tmp'
+        with open(tmp_file, 'w') as file:
+            file.write(content)
+        os.replace(tmp_file, file_name)
+
+    @staticmethod
+    def _histogram_lines(name: str, func_name: str,
+                         histogram: Histogram) -> list[str]:
+        lines = []
+        cumulative = 0
+        bounds = [*map(str, histogram.buckets), '+Inf']
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            lines.append(
+                f'scheduler_{name}_bucket{{func="{func_name}",'
+                f'le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'scheduler_{name}_sum{{func="{func_name}"}} '
+                     f'{histogram.sum}')
+        lines.append(f'scheduler_{name}_count{{func="{func_name}"}} '
+                     f'{histogram.count}')
+        return lines
@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+
+from collections.abc import Iterator
+from typing import Any
+
+
+STREAM_BUFFER_SIZE = 16
+STREAM_BATCH_SIZE = 256
+STREAM_POLL_INTERVAL = 0.1
+STREAM_FLUSH_INTERVAL = 0.01
+STREAM_END = object()
+
+
+class StreamFailure:
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+
+class BoundedStream:
+    def __init__(self, source: Iterator,
+                 buffer_size: int = STREAM_BUFFER_SIZE,
+                 batch_size: int = STREAM_BATCH_SIZE) -> None:
+        self.buffer: queue.Queue = queue.Queue(buffer_size)
+        self.batch_size = batch_size
+        self.closed = threading.Event()
+        self.batch: list = []
+        self.position = 0
+        self.finished = False
+        self.waiting = False
+        self.thread = threading.Thread(
+            target=self._produce, args=(source,), daemon=True
+        )
+        self.thread.start()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            batch, position = self.batch, self.position
+            self.batch, self.position = [], 0
+            yield from batch[position:]
+            if not self._next_batch():
+                return
+
+    def __next__(self) -> Any:
+        while self.position >= len(self.batch):
+            if not self._next_batch():
+                raise StopIteration
+        item = self.batch[self.position]
+        self.position += 1
+        return item
+
+    def close(self) -> None:
+        self.closed.set()
+
+    def _next_batch(self) -> bool:
+        if self.finished:
+            return False
+        batch = self._take()
+        if batch is STREAM_END:
+            self.finished = True
+            return False
+        if isinstance(batch, StreamFailure):
+            self.finished = True
+            raise batch.error
+        self.batch, self.position = batch, 0
+        return True
+
+    def _take(self) -> Any:
+        try:
+            return self.buffer.get_nowait()
+        except queue.Empty:
+            pass
+        self.waiting = True
+        try:
+            while True:
+                try:
+                    return self.buffer.get(timeout=STREAM_POLL_INTERVAL)
+                except queue.Empty:
+                    if self.closed.is_set():
+                        return STREAM_END
+        finally:
+            self.waiting = False
+
+    def _produce(self, source: Iterator) -> None:
+        batch: list = []
+        flush_at = time.monotonic() + STREAM_FLUSH_INTERVAL
+        try:
+            for item in source:
+                batch.append(item)
+                if len(batch) >= self.batch_size or (
+                        self.waiting and time.monotonic() >= flush_at):
+                    if not self._put(batch):
+                        return
+                    batch = []
+                    flush_at = time.monotonic() + STREAM_FLUSH_INTERVAL
+            if batch and not self._put(batch):
+                return
+            self._put(STREAM_END)
+        except Exception as ex:
+            self._put(StreamFailure(ex))
+        finally:
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+
+    def _put(self, item: Any) -> bool:
+        while not self.closed.is_set():
+            try:
+                self.buffer.put(item, timeout=STREAM_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def open_stream(value: Any) -> Any:
+    if isinstance(value, Iterator) and not isinstance(value, BoundedStream):
+        return BoundedStream(value)
+    return value
@@ -0,0 +1,156 @@
+import cProfile
+import fcntl
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import tracemalloc
+
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from typing import Any
+
+from deadlines import Shield
+
+
+PROFILES_FOLDER = './profiles/'
+TOP_ALLOCATIONS = 25
+NO_PROFILE = nullcontext()
+
+_tracing_lock = threading.Lock()
+_tracing_jobs = 0
+
+
+class Profiler:
+    def __init__(self, folder: str = PROFILES_FOLDER,
+                 functions: list[str] | None = None,
+                 sample_rate: float = 1.0, cpu: bool = True,
+                 memory: bool = False,
+                 top_allocations: int = TOP_ALLOCATIONS) -> None:
+        if not 0 < sample_rate <= 1:
+            raise ValueError('Sample rate must be in (0, 1]')
+        if not cpu and not memory:
+            raise ValueError('Enable cpu or memory profiling')
+        self.folder = folder
+        self.functions = set(functions or [])
+        self.sample_rate = sample_rate
+        self.cpu = cpu
+        self.memory = memory
+        self.top_allocations = top_allocations
+
+    def matches(self, func_name: str) -> bool:
+        return not self.functions or func_name in self.functions
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def stats_file(self, func_name: str) -> str:
+        return os.path.join(self.folder, f'{func_name}.prof')
+
+    def memory_file(self, func_name: str) -> str:
+        return os.path.join(self.folder, f'{func_name}.memory.json')
+
+    @contextmanager
+    def profile(self, func_name: str) -> Iterator[None]:
+        profile, tracing = None, False
+        try:
+            with Shield():
+                profile = self._start_cpu()
+                tracing = self.memory and _start_tracing()
+            yield
+        finally:
+            with Shield():
+                self._finish(func_name, profile, tracing)
+
+    def _start_cpu(self) -> cProfile.Profile | None:
+        if not self.cpu or sys.getprofile() is not None:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None
+        return profile
+
+    def _finish(self, func_name: str, profile: cProfile.Profile | None,
+                tracing: bool) -> None:
+        snapshot, peak = None, 0
+        if tracing:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            _stop_tracing()
+        if profile is not None:
+            profile.disable()
+        os.makedirs(self.folder, exist_ok=True)
+        if profile is not None:
+            self._save_stats(func_name, profile)
+        if snapshot is not None:
+            self._save_memory(func_name, snapshot, peak)
+
+    def _save_stats(self, func_name: str, profile: cProfile.Profile) -> None:
+        path = self.stats_file(func_name)
+        with _locked(self.folder):
+            stats = pstats.Stats(profile)
+            if os.path.exists(path):
+                stats.add(path)
+            stats.dump_stats(path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+    def _save_memory(self, func_name: str, snapshot: tracemalloc.Snapshot,
+                     peak: int) -> None:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)
+        ))
+        path = self.memory_file(func_name)
+        with _locked(self.folder):
+            try:
+                with open(path) as file:
+                    summary = json.load(file)
+            except FileNotFoundError:
+                summary = {'runs': 0, 'peak_bytes': 0, 'allocations': {}}
+            summary['runs'] += 1
+            summary['peak_bytes'] = max(summary['peak_bytes'], peak)
+            allocations: dict[str, Any] = summary['allocations']
+            for stat in snapshot.statistics('lineno'):
+                frame = stat.traceback[0]
+                line = allocations.setdefault(
+                    f'{frame.filename}:{frame.lineno}',
+                    {'size': 0, 'count': 0}
+                )
+                line['size'] += stat.size
+                line['count'] += stat.count
+            summary['allocations'] = dict(sorted(
+                allocations.items(), key=lambda item: -item[1]['size']
+            )[:self.top_allocations])
+            with open(path + '.tmp', 'w') as file:
+                json.dump(summary, file, indent=2)
+            os.replace(path + '.tmp', path)
+
+
+def _start_tracing() -> bool:
+    global _tracing_jobs
+    with _tracing_lock:
+        if not _tracing_jobs:
+            if tracemalloc.is_tracing():
+                return False
+            tracemalloc.start()
+        _tracing_jobs += 1
+    return True
+
+
+def _stop_tracing() -> None:
+    global _tracing_jobs
+    with _tracing_lock:
+        _tracing_jobs -= 1
+        if not _tracing_jobs:
+            tracemalloc.stop()
+
+
+@contextmanager
+def _locked(folder: str) -> Iterator[None]:
+    with open(os.path.join(folder, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
@@ -0,0 +1,35 @@
+import random
+
+
+BACKOFF_KINDS = ('fixed', 'exponential', 'jitter')
+
+
+class RetryPolicy:
+    def __init__(self, kind: str = 'exponential', delay: float = 1.0,
+                 max_delay: float = 60.0, multiplier: float = 2.0,
+                 retry_on: tuple[type[Exception], ...] = (Exception,)
+                 ) -> None:
+        if kind not in BACKOFF_KINDS:
+            raise ValueError(
+                f'Unknown backoff kind "{kind}", '
+                f'expected one of {BACKOFF_KINDS}'
+            )
+        self.kind = kind
+        self.delay = delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.retry_on = retry_on
+
+    def should_retry(self, er: Exception) -> bool:
+        return isinstance(er, self.retry_on)
+
+    def next_delay(self, attempt: int, previous_delay: float = 0.0) -> float:
+        if self.kind == 'fixed':
+            delay = self.delay
+        elif self.kind == 'exponential':
+            delay = self.delay * self.multiplier ** (attempt - 1)
+        else:
+            delay = random.uniform(
+                self.delay, max(previous_delay, self.delay) * 3
+            )
+        return min(delay, self.max_delay)
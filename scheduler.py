@@ -1,15 +1,39 @@
+import heapq
 import logging
-import pickle
 import os
+import socket
+import threading
+import time
 
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
 from multiprocessing import Process, Queue, Value
-from queue import Empty
+from queue import Empty, SimpleQueue
 from uuid import uuid4
 from typing import Any, Generator
 
+from cache import ResultCache
+from channel import Command, SchedulerClient, SchedulerServer
+from dag import assign_uids, walk_dependencies
 from job import Job
-from exceptions import StopExecution
-from utils import scheduler_logger
+from limits import ResourceLimiter
+from logs import log_event
+from executors import EXECUTION_MODES, create_executor, job_runner
+from exceptions import StopExecution, TenantBacklogException
+from handoff import SharedResultStore
+from metrics import METRICS_FORMATS, Metrics
+from profiling import Profiler
+from serialization import load_job
+from storage import (
+    FINAL_STATUSES, HANDED_OFF_STATUS, LEASE_BUSY, LEASE_MISSING,
+    QUEUED_STATUS, FileTaskStore, SQLiteTaskStore, StatusJournal,
+    WaitingQueue, record_tenant
+)
+from utils import scheduler_logger, format_start_at, parse_start_at
+
+
+MAX_IDLE_TIMEOUT = 3600.0
+FINAL_STATUSES_KEPT = 10000
 
 
 class Scheduler:
@@ -18,47 +42,141 @@ class Scheduler:
 
     def __init__(self, pool_size=10, tasks_folder: str = './tasks/',
                  statuses_file: str = 'statuses.txt',
-                 waiting_tasks_file: str = 'waiting_tasks.txt') -> None:
+                 waiting_tasks_file: str = 'waiting_tasks.txt',
+                 execution_mode: str = 'sync',
+                 compact_every: int = 1000,
+                 priority_aging: float = 1.0,
+                 task_store: FileTaskStore | SQLiteTaskStore | None = None,
+                 result_cache: ResultCache | None = None,
+                 result_store: SharedResultStore | None = None,
+                 metrics_file: str | None = None,
+                 metrics_format: str = 'json',
+                 metrics_interval: float = 10.0,
+                 address: str | None = None,
+                 authkey: bytes | None = None,
+                 lease_seconds: float = 0.0,
+                 poll_interval: float = 1.0,
+                 resource_limits: dict[str, int] | None = None,
+                 rate_limits: dict[str, float] | None = None,
+                 tenant_weights: dict[str, float] | None = None,
+                 tenant_backlog: dict[str, int] | None = None,
+                 profiler: Profiler | None = None
+                 ) -> None:
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(
+                f'Unknown execution mode "{execution_mode}", '
+                f'expected one of {EXECUTION_MODES}'
+            )
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(
+                f'Unknown metrics format "{metrics_format}", '
+                f'expected one of {METRICS_FORMATS}'
+            )
         self.pool_size = pool_size
         self.tasks_folder = tasks_folder
         self.statuses_file = statuses_file
         self.waiting_tasks_file = waiting_tasks_file
         self.task_coroutine = self._run_task_coroutine()
         self.task_coroutine.send(None)
-        self.current_count_tasks = Value('i', 0)
+        self.timers: list[tuple[float, str]] = []
+        self.planned_tasks: set[str] = set()
+        self.execution_mode = execution_mode
+        self.executor: Executor | None = None
+        self.running_tasks: dict[str, Future] = {}
+        self.jobs: dict[str, Job] = {}
+        self.task_store = task_store or FileTaskStore(tasks_folder)
+        self.result_cache = result_cache
+        self.result_store = result_store
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_format = metrics_format
+        self.metrics_interval = metrics_interval
+        self.next_metrics_dump = 0.0
+        self.dispatched_at: dict[str, float] = {}
+        self.final_statuses: OrderedDict[str, str] = OrderedDict()
+        self.address = address or statuses_file + '.sock'
+        self.authkey = authkey or os.urandom(32)
+        self.client = SchedulerClient(self.address, self.authkey)
+        self.inbox: SimpleQueue = SimpleQueue()
+        self.consuming = False
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.owner = ''
+        self.next_heartbeat = 0.0
+        self.next_poll = 0.0
+        self.limiter = ResourceLimiter(resource_limits, rate_limits)
+        self.acquired: dict[str, list[str]] = {}
+        self.tenant_backlog = dict(tenant_backlog or {})
+        self.profiler = profiler
         self.__create_necessary_dependencies()
+        self.statuses = StatusJournal(statuses_file, compact_every)
+        self.waiting = WaitingQueue(
+            waiting_tasks_file, priority_aging, compact_every,
+            weights=tenant_weights
+        )
+        self.current_count_tasks = Value('i', len(self.statuses.load()))
 
-    def schedule(self, task: Job) -> None:
+    def schedule(self, task: Job) -> str | None:
         if not isinstance(task, Job):
             print('This scheduler supports only Job instances')
-            return
-        dependencies = task.dependencies
-        task.uid = str(uuid4())
-        scheduler_logger.info(f'Adding task - {task.uid} {task.func.__name__}')
-        with open(self.tasks_folder + str(task.uid), 'wb') as task_file:
-            pickle.dump(task, task_file)
-            for dt in dependencies:
-                dt.uid = str(uuid4())
-                pickle.dump(dt, task_file)
-
-        if self.current_count_tasks.value >= self.pool_size:  # type: ignore
-            with open(self.waiting_tasks_file, 'a') as waiting_file:
-                waiting_file.write(
-                    f'{task.uid};{task.start_at};{task.func.__name__};'
-                    f'{[d.uid for d in task.dependencies]};wait\n'
-                )
-                return
-        self.current_count_tasks.value += 1  # type: ignore
-        with open(self.statuses_file, 'a') as status_file:
-            status_file.write(
-                f'{task.uid};{task.start_at};{task.func.__name__};'
-                f'{[d.uid for d in task.dependencies]};wait\n'
-            )
+            return None
+        if self._is_running():
+            return self.client.submit(task)
+        self._prepare_task(task)
+        queued = (
+            self.current_count_tasks.value >= self.pool_size  # type: ignore
+        )
+        if queued:
+            self._check_backlog([task])
+        log_event(scheduler_logger, logging.INFO, 'Adding task',
+                  uid=task.uid, func=task.func.__name__)
+        self.task_store.save(task)
+
+        task_record = self._task_record(task, f'{time.time():.6f}')
+        if queued:
+            self.waiting.push(task_record)
+        else:
+            self.current_count_tasks.value += 1  # type: ignore
+            self.statuses.add(task_record)
+        if self.consuming:
+            self.queue.put(task_record)
+        else:
+            self.metrics.increment('submitted', task.func.__name__)
+        return task.uid
+
+    def schedule_many(self, tasks: list[Job]) -> list[str]:
+        if not all(isinstance(task, Job) for task in tasks):
+            print('This scheduler supports only Job instances')
+            return []
+        if not tasks:
+            return []
+        if self._is_running():
+            return self.client.submit_many(tasks)
+        task_records = self._store_tasks(tasks)
+        if self.consuming:
+            self.queue.put(task_records)
+        else:
+            for task in tasks:
+                self.metrics.increment('submitted', task.func.__name__)
+        return [task.uid for task in tasks]
+
+    def cancel(self, task_uid: str) -> bool:
+        return self.client.cancel(task_uid)
+
+    def query(self, task_uid: str) -> str | None:
+        return self.client.query(task_uid)
+
+    def metrics_snapshot(self) -> dict[str, Any]:
+        if self._is_running():
+            return self.client.metrics()
+        return self.metrics.snapshot()
 
     def start(self) -> None:
         print('Start scheduler')
         self.run_process = Process(target=self.run, args=())
         self.run_process.start()
+        self.waiting.loaded = False
+        self.metrics = Metrics()
 
     def run(self, task_uid: str | None = None) -> tuple[Any | None, int] | None:
         if task_uid:
@@ -70,119 +188,525 @@ class Scheduler:
             f'Start scheduler. Tasks in the queue - '
             f'{self.current_count_tasks.value}'  # type: ignore
         )
+        if self.__clear_queue():
+            return None
+        self.consuming = True
+        threading.Thread(target=self._forward_queue, daemon=True).start()
+        server = SchedulerServer(self.address, self.inbox, self.authkey)
+        server.start()
         run_coroutine = self._run_coroutine()
-        while True:
-            run_coroutine.send(None)
-            if not self.queue.empty():
-                self.__clear_queue()
+        timeout = run_coroutine.send(None)
+        try:
+            while True:
                 try:
-                    run_coroutine.throw(StopExecution)
-                except StopIteration:
-                    return None
+                    message = self.inbox.get(timeout=timeout)
+                except Empty:
+                    message = None
+                if message is StopExecution:
+                    server.close()
+                    try:
+                        run_coroutine.throw(StopExecution)
+                    except StopIteration:
+                        return None
+                timeout = run_coroutine.send(message)
+        finally:
+            self.consuming = False
+            server.close()
 
     def stop(self) -> None:
         if self.run_process:
             self.queue.put(StopExecution)
             print('Completion of tasks execution...')
             self.run_process.join(10)
+            self.client.close()
             scheduler_logger.info('Stop scheduler execution')
         else:
             print('Scheduler not running')
 
+    def _store_tasks(self, tasks: list[Job],
+                     durable: bool = True) -> list[list[str]]:
+        for task in tasks:
+            self._prepare_task(task)
+        free_slots = max(
+            self.pool_size - self.current_count_tasks.value, 0  # type: ignore
+        )
+        self._check_backlog(tasks[free_slots:])
+        self.task_store.save_many(tasks)
+
+        enqueued_at = f'{time.time():.6f}'
+        task_records = [self._task_record(task, enqueued_at) for task in tasks]
+        self.current_count_tasks.value += min(  # type: ignore
+            free_slots, len(task_records)
+        )
+        self.statuses.add_many(task_records[:free_slots], durable)
+        self.waiting.push_many(task_records[free_slots:], durable)
+        log_event(scheduler_logger, logging.INFO, 'Adding tasks in a batch',
+                  count=len(tasks))
+        return task_records
+
+    def _check_backlog(self, tasks: list[Job]) -> None:
+        if not self.tenant_backlog:
+            return
+        if not self.waiting.loaded:
+            self.waiting.load()
+        if self.waiting.pending:
+            self.waiting.journal.load_remaining()
+        queued: dict[str, int] = {}
+        for task in tasks:
+            queued[task.tenant] = queued.get(task.tenant, 0) + 1
+        for tenant, count in queued.items():
+            limit = self.tenant_backlog.get(tenant)
+            backlog = self.waiting.backlog.get(tenant, 0)
+            if limit is not None and backlog + count > limit:
+                raise TenantBacklogException(
+                    f'Tenant "{tenant}" has {backlog} queued tasks, '
+                    f'backlog limit is {limit}'
+                )
+
+    def _is_running(self) -> bool:
+        return (self.run_process is not None
+                and self.run_process.pid != os.getpid()
+                and self.run_process.is_alive())
+
+    def _forward_queue(self) -> None:
+        while True:
+            message = self.queue.get()
+            self.inbox.put(message)
+            if message is StopExecution:
+                return
+
+    def _prepare_task(self, task: Job) -> None:
+        if task.schedule is not None and self._first_fire(task) is None:
+            raise ValueError(
+                f'Schedule of {task.func.__name__} has no occurrences left'
+            )
+        task.uid = str(uuid4())
+        assign_uids(task)
+        if task.result_store is None:
+            task.result_store = self.result_store
+        for node in [task, *walk_dependencies(task)]:
+            if (node.profiler is None and self.profiler is not None
+                    and self.profiler.matches(node.func.__name__)):
+                node.profiler = self.profiler
+
+    @staticmethod
+    def _first_fire(task: Job) -> float | None:
+        return task.schedule.next_fire(  # type: ignore
+            max(task.start_ts, task.schedule.start)  # type: ignore
+        )
+
+    def _task_record(self, task: Job, enqueued_at: str) -> list[str]:
+        task_record = [
+            task.uid, task.start_at, task.func.__name__,
+            str([d.uid for d in task.dependencies]), 'wait',
+            str(task.priority), enqueued_at
+        ]
+        if task.schedule is not None:
+            task_record[1] = format_start_at(
+                self._first_fire(task) or task.start_ts
+            )
+            task_record.append('0')
+        if task.tenant:
+            task_record += [''] * (8 - len(task_record)) + [task.tenant]
+        return task_record
+
     def _delete_outdated_task(self, task_uid: str) -> None:
-        for file in os.listdir(self.tasks_folder):
-            if file == task_uid:
-                try:
-                    os.remove(self.tasks_folder + file)
-                    return
-                except OSError as ex:
-                    scheduler_logger.error(
-                        f'Error while deleting task {task_uid}: {ex}'
-                    )
-        scheduler_logger.error(f'Cannot find task {task_uid} for deleting')
+        self.jobs.pop(task_uid, None)
+        try:
+            if self.task_store.delete(task_uid):
+                return
+        except OSError as ex:
+            log_event(scheduler_logger, logging.ERROR,
+                      'Error while deleting task', uid=task_uid,
+                      error=str(ex))
+            return
+        log_event(scheduler_logger, logging.ERROR,
+                  'Cannot find task for deleting', uid=task_uid)
 
     def _refresh_statuses(self, tasks: list) -> None:
-        task_ids = [task[0] for task in tasks]
-        with open(self.statuses_file, 'r') as file:
-            for task_line in file.readlines():
-                task = task_line.strip().split(';')
-                if task[0] not in task_ids:
-                    tasks.append(task)
-        with open(self.statuses_file, 'w') as file:
-            for task in tasks:
-                if task[4] not in ('finished', 'fail'):
-                    file.write(';'.join(task) + '\n')
-                else:
-                    waiting_task = self._get_first_in_queue()
-                    if waiting_task.strip():
-                        file.write(waiting_task)
-                    else:
-                        self.current_count_tasks.value -= 1  # type: ignore
-                    self._delete_outdated_task(task[0])
+        finished_tasks = [task for task in tasks if task[4] in FINAL_STATUSES]
+        self.statuses.append_many(finished_tasks)
+        for task in finished_tasks:
+            self._remember_final_status(task[0], task[4])
+            if task[4] == HANDED_OFF_STATUS:
+                self.jobs.pop(task[0], None)
+            else:
+                self._delete_outdated_task(task[0])
+        waiting_tasks = self.waiting.pop_many(len(finished_tasks))
+        for waiting_task in waiting_tasks:
+            waiting_task[4] = 'wait'
+        self.statuses.append_many(waiting_tasks)
+        for waiting_task in waiting_tasks:
+            self._plan_task(waiting_task)
+        self.current_count_tasks.value -= (  # type: ignore
+            len(finished_tasks) - len(waiting_tasks)
+        )
 
     def _update_single_task_status(
             self, task_uid: str,
             status: tuple[Any | None, int] | None = None) -> None:
-        with open(self.statuses_file, 'r') as status_file:
-            all_task_statuses = status_file.readlines()
-        if status:
-            status = status[1]  # type: ignore
-        with open(self.statuses_file, 'w') as status_file:
-            for task in all_task_statuses:
-                if task_uid in task:
-                    if status in (1, None):
-                        self._delete_outdated_task(task_uid)
-                        continue
-                status_file.write(task)
-
-    def _get_first_in_queue(self) -> str:
-        with open(self.waiting_tasks_file, 'r+') as waiting_file:
-            waiting_task = waiting_file.readline()
-            data = waiting_file.read()
-            waiting_file.seek(0)
-            waiting_file.write(data)
-            waiting_file.truncate()
-            return waiting_task
+        if status and status[1] == 0:
+            return
+        self.statuses.append(
+            [task_uid, '', '', '[]', 'finished' if status else 'fail']
+        )
+        self._delete_outdated_task(task_uid)
 
     def _run_coroutine(self) -> Generator:
+        started = time.perf_counter()
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}'
+        self.executor = create_executor(self.execution_mode, self.pool_size)
+        self.waiting.load()
+        for task in list(self.statuses.load().values()):
+            self._plan_task(task)
+        self._report_recovery(time.perf_counter() - started)
         while True:
             try:
-                (yield)
+                message = (yield self._time_to_next_task())
             except StopExecution:
+                self._shutdown()
                 return None
-            finally:
-                actual_tasks = []
-                with open(self.statuses_file, 'r') as status_file:
-                    for task_line in status_file.readlines():
-                        actual_tasks.append(task_line.strip().split(';'))
-                for task in actual_tasks:
-                    status = self.task_coroutine.send(task[0])
-                    if not status:
-                        task[4] = 'fail'
-                        logging.warning(
-                            f'Task {task[0]} completed with an error'
-                        )
-                    elif status[1] == 1:
-                        task[4] = 'finished'
-                        logging.info(f'Task {task[0]} successfully completed')
-                    elif status[1] == 0:
-                        task[4] = 'wait'
-                    self.task_coroutine.send(None)
-                self._refresh_statuses(actual_tasks)
+            self._handle_message(message)
+            if self.lease_seconds > 0:
+                self._share_tasks()
+            self._dispatch_due_tasks()
+            while self._collect_finished_tasks():
+                self._dispatch_due_tasks()
+            if self.waiting.pending:
+                self.waiting.load_batch()
+            self._update_metrics()
+
+    def _shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        self._collect_finished_tasks()
+        self.statuses.compact()
+        self.waiting.compact()
+        self._update_metrics(force=True)
+
+    def _handle_message(self, message: Any) -> None:
+        if isinstance(message, Command):
+            self._handle_command(message)
+        elif message is not None and isinstance(message[0], list):
+            for task in message:
+                self._accept_task(task)
+        elif message is not None:
+            self._accept_task(message)
+
+    def _handle_command(self, command: Command) -> None:
+        try:
+            if command.action == 'submit':
+                tasks = [load_job(data) for data in command.payload]
+                for task in self._store_tasks(tasks, durable=False):
+                    self._accept_task(task)
+                command.reply.set_result([task.uid for task in tasks])
+            elif command.action == 'cancel':
+                command.reply.set_result(self._cancel_task(command.payload))
+            elif command.action == 'metrics':
+                command.reply.set_result(self.metrics.snapshot())
+            else:
+                command.reply.set_result(self._task_state(command.payload))
+        except Exception as ex:
+            command.reply.set_exception(ex)
+
+    def _cancel_task(self, task_uid: str) -> bool:
+        if task_uid in self.running_tasks:
+            if not self.running_tasks[task_uid].cancel():
+                return False
+            del self.running_tasks[task_uid]
+            self.limiter.release(self.acquired.pop(task_uid, []))
+            self.dispatched_at.pop(task_uid, None)
+        elif task_uid in self.planned_tasks:
+            self.planned_tasks.discard(task_uid)
+        else:
+            task = self.waiting.remove(task_uid)
+            if task is None:
+                return False
+            self._remember_final_status(task_uid, 'cancelled')
+            self._delete_outdated_task(task_uid)
+            self.metrics.increment('cancelled', task[2])
+            return True
+        task = self.statuses.records[task_uid]
+        task[4] = 'cancelled'
+        self.metrics.increment('cancelled', task[2])
+        self._refresh_statuses([task])
+        log_event(scheduler_logger, logging.INFO, 'Task cancelled',
+                  uid=task_uid)
+        return True
+
+    def _task_state(self, task_uid: str) -> str | None:
+        if task_uid in self.running_tasks:
+            return 'running'
+        if task_uid in self.statuses.records:
+            return self.statuses.records[task_uid][4]
+        if task_uid in self.waiting.journal.records:
+            return QUEUED_STATUS
+        return self.final_statuses.get(task_uid)
+
+    def _remember_final_status(self, task_uid: str, status: str) -> None:
+        self.final_statuses[task_uid] = status
+        while len(self.final_statuses) > FINAL_STATUSES_KEPT:
+            self.final_statuses.popitem(last=False)
+
+    def _accept_task(self, task: list[str]) -> None:
+        self.metrics.increment('submitted', task[2])
+        if task[4] == QUEUED_STATUS:
+            self.waiting.apply(task)
+        else:
+            self._plan_task(task)
+
+    def _plan_task(self, task: list[str]) -> None:
+        if task[0] in self.planned_tasks or task[0] in self.running_tasks:
+            return
+        if task[0] not in self.statuses.records:
+            self.statuses.apply(task)
+        self.planned_tasks.add(task[0])
+        heapq.heappush(self.timers, (parse_start_at(task[1]), task[0]))
+
+    def _report_recovery(self, seconds: float) -> None:
+        self.metrics.set_gauge('recovery_seconds', seconds)
+        self.metrics.set_gauge(
+            'recovered_tasks', len(self.statuses.records) + len(self.waiting)
+        )
+        scheduler_logger.info(
+            f'Recovered {len(self.statuses.records)} active and '
+            f'{len(self.waiting)} waiting tasks in {seconds * 1000:.1f} ms, '
+            f'{self.waiting.journal.unread} waiting records load lazily'
+        )
+
+    def _time_to_next_task(self) -> float | None:
+        if self.waiting.pending:
+            return 0
+        wake_at = [ts for ts, _ in self.timers[:1]]
+        if self.metrics_file:
+            wake_at.append(self.next_metrics_dump)
+        resource_wake = self.limiter.next_wake(time.time())
+        if resource_wake is not None:
+            wake_at.append(resource_wake)
+        if self.lease_seconds > 0:
+            wake_at.append(self.next_poll)
+            if self.running_tasks:
+                wake_at.append(self.next_heartbeat)
+        if not wake_at:
+            return None
+        return min(max(min(wake_at) - time.time(), 0), MAX_IDLE_TIMEOUT)
+
+    def _share_tasks(self) -> None:
+        now = time.time()
+        if self.running_tasks and now >= self.next_heartbeat:
+            self.task_store.renew(
+                self.owner, list(self.running_tasks), self.lease_seconds
+            )
+            self.next_heartbeat = now + self.lease_seconds / 3
+        if now < self.next_poll:
+            return
+        self.next_poll = now + self.poll_interval
+        free_slots = self.pool_size - len(self.running_tasks)
+        if free_slots <= 0:
+            return
+        for task_uid, due_at, func_name in self.task_store.claimable(
+                now, free_slots):
+            if (task_uid in self.statuses.records
+                    or task_uid in self.waiting.journal.records):
+                continue
+            task = [task_uid, '', func_name, '[]', 'wait', '0', f'{now:.6f}']
+            self.statuses.append(task)
+            self.current_count_tasks.value += 1  # type: ignore
+            self.planned_tasks.add(task_uid)
+            heapq.heappush(self.timers, (due_at, task_uid))
+            log_event(scheduler_logger, logging.INFO,
+                      'Picked up shared task', uid=task_uid)
+
+    def _update_metrics(self, force: bool = False) -> None:
+        self.metrics.set_gauge('pool_size', self.pool_size)
+        self.metrics.set_gauge('running_tasks', len(self.running_tasks))
+        self.metrics.set_gauge('planned_tasks', len(self.planned_tasks))
+        self.metrics.set_gauge('waiting_tasks', len(self.waiting))
+        self.metrics.set_gauge('parked_tasks', len(self.limiter))
+        now = time.time()
+        if self.metrics_file and (force or now >= self.next_metrics_dump):
+            self.metrics.dump(self.metrics_file, self.metrics_format)
+            self.next_metrics_dump = now + self.metrics_interval
+
+    def _dispatch_due_tasks(self) -> None:
+        for item in self.limiter.unpark(time.time()):
+            heapq.heappush(self.timers, item)
+        while self.timers and self.timers[0][0] < time.time():
+            due_at, task_uid = heapq.heappop(self.timers)
+            if task_uid not in self.planned_tasks:
+                continue
+            self.planned_tasks.discard(task_uid)
+            if self.lease_seconds > 0 and not self._claim_task(task_uid):
+                continue
+            job = self._load_task(task_uid)
+            if job is not None and job.resources:
+                blocked = self.limiter.acquire(job.resources, time.time())
+                if blocked is not None:
+                    self.planned_tasks.add(task_uid)
+                    self.limiter.park(blocked, (due_at, task_uid))
+                    continue
+                self.acquired[task_uid] = job.resources
+            if job is None:
+                future: Future = Future()
+                future.set_result((None, job))
+            else:
+                self._observe_start(task_uid, due_at)
+                self.task_store.set_state(task_uid, 'running', attempt=True)
+                future = self.executor.submit(  # type: ignore
+                    job_runner(self.execution_mode), job
+                )
+            self.running_tasks[task_uid] = future
+            if not future.done():
+                future.add_done_callback(self._wake_up)
+
+    def _collect_finished_tasks(self) -> bool:
+        actual_tasks = []
+        for task_uid, future in list(self.running_tasks.items()):
+            if not future.done() or future.cancelled():
+                continue
+            del self.running_tasks[task_uid]
+            self.limiter.release(self.acquired.pop(task_uid, []))
+            task = self.statuses.records[task_uid]
+            try:
+                status, job = future.result()
+            except Exception as ex:
+                log_event(scheduler_logger, logging.ERROR, 'Worker failed',
+                          uid=task_uid, error=str(ex))
+                status, job = None, None
+            duration = self._observe_finish(task, status, job)
+            if not status:
+                task[4] = 'fail'
+                log_event(scheduler_logger, logging.WARNING,
+                          'Task completed with an error', uid=task_uid,
+                          func=task[2], duration=duration)
+            elif status[1] == 1:
+                task[4] = 'finished'
+                log_event(scheduler_logger, logging.INFO,
+                          'Task successfully completed', uid=task_uid,
+                          func=task[2], duration=duration)
+            else:
+                task[4] = 'wait'
+                if job is not None:
+                    self.jobs[task_uid] = job
+                delay = status[0] if status[1] == 2 else 1
+                self._replan_task(task_uid, time.time() + delay)
+            if task[4] in FINAL_STATUSES:
+                self._plan_next_occurrence(task, job)
+            actual_tasks.append(task)
+        if actual_tasks:
+            self._refresh_statuses(actual_tasks)
+        return bool(actual_tasks)
+
+    def _plan_next_occurrence(self, task: list[str],
+                              job: Job | None) -> None:
+        job = job or self.jobs.get(task[0])
+        if job is None or job.schedule is None or len(task) < 8:
+            return
+        fired = int(task[7]) + 1
+        fire_at = job.schedule.next_fire(time.time(), fired)
+        if fire_at is None:
+            log_event(scheduler_logger, logging.INFO, 'Schedule ended',
+                      uid=task[0], occurrences=fired)
+            return
+        task[1], task[4] = format_start_at(fire_at), 'wait'
+        task[7] = str(fired)
+        job.reset_dependencies()
+        self.jobs[task[0]] = job
+        self.statuses.append(task)
+        self.task_store.clear_dependencies(task[0])
+        self._replan_task(task[0], fire_at)
+
+    def _replan_task(self, task_uid: str, fire_at: float) -> None:
+        job = self.jobs.get(task_uid)
+        if self.lease_seconds > 0 and job is not None:
+            self.task_store.defer(job, self.owner, fire_at)
+        else:
+            self.task_store.set_state(task_uid, 'wait')
+            if self.lease_seconds > 0:
+                self.task_store.release(task_uid, self.owner)
+        self.planned_tasks.add(task_uid)
+        heapq.heappush(self.timers, (fire_at, task_uid))
+
+    def _claim_task(self, task_uid: str) -> bool:
+        claim = self.task_store.claim(
+            task_uid, self.owner, self.lease_seconds
+        )
+        if claim == LEASE_BUSY:
+            self.jobs.pop(task_uid, None)
+            self.planned_tasks.add(task_uid)
+            heapq.heappush(
+                self.timers, (time.time() + self.lease_seconds, task_uid)
+            )
+            return False
+        if claim == LEASE_MISSING:
+            task = self.statuses.records[task_uid]
+            task[4] = HANDED_OFF_STATUS
+            log_event(scheduler_logger, logging.INFO,
+                      'Task was completed by another scheduler',
+                      uid=task_uid)
+            self._refresh_statuses([task])
+            return False
+        return True
+
+    def _observe_start(self, task_uid: str, due_at: float) -> None:
+        task = self.statuses.records[task_uid]
+        now = time.time()
+        enqueued_at = float(task[6]) if len(task) > 6 else due_at
+        wait = now - max(due_at, enqueued_at)
+        self.metrics.increment('started', task[2])
+        self.metrics.observe('queue_wait_seconds', task[2], wait)
+        tenant = record_tenant(task)
+        if tenant:
+            self.metrics.observe(
+                'queue_wait_seconds', f'tenant:{tenant}', wait
+            )
+        self.dispatched_at[task_uid] = now
+
+    def _observe_finish(self, task: list[str],
+                        status: tuple[Any | None, int] | None,
+                        job: Job | None) -> float | None:
+        started = self.dispatched_at.pop(task[0], None)
+        duration = None
+        if started is not None:
+            duration = time.time() - started
+            self.metrics.observe('execution_seconds', task[2], duration)
+        if job is not None and job.last_error == 'WorkingTimeoutException':
+            self.metrics.increment('timed_out', task[2])
+        retries = job.run_attempts - 1 if job is not None else 0
+        if not status:
+            self.metrics.increment('failed', task[2])
+        elif status[1] == 1:
+            self.metrics.increment('succeeded', task[2])
+        elif status[1] == 2:
+            retries += 1
+        if retries > 0:
+            self.metrics.increment('retried', task[2], retries)
+        return duration
+
+    def _wake_up(self, future: Future) -> None:
+        self.inbox.put(None)
+
+    def _load_task(self, task_uid: str) -> Job | None:
+        if task_uid in self.jobs:
+            return self.jobs[task_uid]
+        job = self.task_store.load(task_uid)
+        if job is None:
+            log_event(scheduler_logger, logging.ERROR, 'Task not found',
+                      uid=task_uid)
+            return None
+        if self.result_cache is not None:
+            for node in [job, *walk_dependencies(job)]:
+                if node.cache_ttl > 0 and node.result_cache is None:
+                    node.result_cache = self.result_cache
+        self.jobs[task_uid] = job
+        return job
 
     def _run_task_coroutine(self) -> Generator:
         while task_uid := (yield):
-            try:
-                with open(self.tasks_folder + task_uid, 'rb') as task_file:
-                    job = pickle.load(task_file)
-                    yield job.run()
-            except FileNotFoundError:
-                scheduler_logger.error(f'Task with uid {task_uid} not found')
-                yield None
+            job = self._load_task(task_uid)
+            yield job.run() if job else None
 
     def __create_necessary_dependencies(self) -> None:
-        if not os.path.exists(self.tasks_folder):
-            os.makedirs(self.tasks_folder)
         if not os.path.exists(self.waiting_tasks_file):
             with open(self.waiting_tasks_file, 'w'):
                 pass
@@ -190,9 +714,11 @@ class Scheduler:
             with open(self.statuses_file, 'w'):
                 pass
 
-    def __clear_queue(self):
+    def __clear_queue(self) -> bool:
+        stop_requested = False
         try:
             while True:
-                self.queue.get_nowait()
+                if self.queue.get_nowait() is StopExecution:
+                    stop_requested = True
         except Empty:
-            pass
+            return stop_requested
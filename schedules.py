@@ -0,0 +1,146 @@
+import bisect
+import math
+import time
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+from utils import parse_start_at
+
+
+CRON_MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@hourly': '0 * * * *'
+}
+CRON_FIELDS = (
+    ('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31),
+    ('month', 1, 12), ('weekday', 0, 7)
+)
+MAX_SEARCH_YEARS = 8
+
+
+class Schedule(ABC):
+    def __init__(self, start_at: str = '', end_at: str = '',
+                 count: int = 0) -> None:
+        self.start = parse_start_at(start_at) or time.time()
+        self.end = parse_start_at(end_at) or math.inf
+        self.count = count
+
+    def next_fire(self, since: float, fired: int = 0) -> float | None:
+        if self.count and fired >= self.count:
+            return None
+        fire_at = self._next(max(since, self.start))
+        if fire_at is None or fire_at > self.end:
+            return None
+        return fire_at
+
+    @abstractmethod
+    def _next(self, since: float) -> float | None:
+        pass
+
+
+class IntervalSchedule(Schedule):
+    def __init__(self, every: float, start_at: str = '', end_at: str = '',
+                 count: int = 0) -> None:
+        if every <= 0:
+            raise ValueError('Schedule interval must be positive')
+        super().__init__(start_at, end_at, count)
+        self.every = every
+
+    def _next(self, since: float) -> float:
+        steps = math.ceil((since - self.start) / self.every)
+        return self.start + steps * self.every
+
+
+class CronSchedule(Schedule):
+    def __init__(self, expression: str, start_at: str = '', end_at: str = '',
+                 count: int = 0) -> None:
+        super().__init__(start_at, end_at, count)
+        self.expression = expression
+        fields = CRON_MACROS.get(expression, expression).split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(
+                f'Cron expression "{expression}" must have '
+                f'{len(CRON_FIELDS)} fields'
+            )
+        (self.minutes, self.hours, self.days, self.months,
+         weekdays) = [
+            self._parse_field(field, low, high)
+            for field, (_, low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.weekdays = sorted({day % 7 for day in weekdays})
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _next(self, since: float) -> float | None:
+        moment = datetime.fromtimestamp(math.ceil(since / 60) * 60)
+        last_year = moment.year + MAX_SEARCH_YEARS
+        while moment.year <= last_year:
+            if moment.month not in self.months:
+                index = bisect.bisect_right(self.months, moment.month)
+                if index < len(self.months):
+                    moment = moment.replace(
+                        month=self.months[index], day=1, hour=0, minute=0
+                    )
+                else:
+                    moment = moment.replace(
+                        year=moment.year + 1, month=self.months[0], day=1,
+                        hour=0, minute=0
+                    )
+                continue
+            if not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(
+                    hour=0, minute=0
+                )
+                continue
+            if moment.hour not in self.hours:
+                index = bisect.bisect_right(self.hours, moment.hour)
+                if index < len(self.hours):
+                    moment = moment.replace(hour=self.hours[index], minute=0)
+                else:
+                    moment = (moment + timedelta(days=1)).replace(
+                        hour=0, minute=0
+                    )
+                continue
+            if moment.minute not in self.minutes:
+                index = bisect.bisect_right(self.minutes, moment.minute)
+                if index < len(self.minutes):
+                    moment = moment.replace(minute=self.minutes[index])
+                else:
+                    moment = (moment + timedelta(hours=1)).replace(minute=0)
+                continue
+            return moment.timestamp()
+        return None
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> list[int]:
+        values: set[int] = set()
+        for part in field.split(','):
+            part_range, _, step = part.partition('/')
+            if part_range == '*':
+                start, stop = low, high
+            elif '-' in part_range:
+                start, stop = map(int, part_range.split('-'))
+            else:
+                start = stop = int(part_range)
+                if step:
+                    stop = high
+            if not low <= start <= stop <= high:
+                raise ValueError(
+                    f'Cron field "{field}" is out of range {low}-{high}'
+                )
+            values.update(range(start, stop + 1, int(step or 1)))
+        return sorted(values)
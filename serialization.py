@@ -0,0 +1,88 @@
+import importlib
+import pickle
+
+from collections.abc import Callable
+
+from dag import walk_dependencies
+from job import Job
+
+
+COMPACT_FORMAT = b'J2'
+PICKLE_FORMAT = b'P1'
+JOB_FIELDS = (
+    'start_at', 'max_working_time', 'tries', 'return_arg', 'priority',
+    'dependency_mode', 'cache_ttl', 'result_cache', 'retry_policy',
+    'schedule', 'result_store', 'resources', 'tenant', 'profiler'
+)
+RETRY_STATE_FIELDS = ('attempts', 'retry_delay')
+
+
+def function_path(func: Callable) -> str | None:
+    module = getattr(func, '__module__', None)
+    qualname = getattr(func, '__qualname__', '')
+    if not module or '<' in qualname:
+        return None
+    path = f'{module}:{qualname}'
+    try:
+        if resolve_function(path) is not func:
+            return None
+    except (ImportError, AttributeError):
+        return None
+    return path
+
+
+def resolve_function(path: str) -> Callable:
+    module_name, qualname = path.split(':')
+    obj = importlib.import_module(module_name)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj  # type: ignore
+
+
+def dump_job(job: Job) -> bytes:
+    nodes = [*walk_dependencies(job), job]
+    indexes = {id(node): index for index, node in enumerate(nodes)}
+    records = []
+    for node in nodes:
+        path = function_path(node.func)
+        if path is None:
+            return PICKLE_FORMAT + pickle.dumps(
+                job, pickle.HIGHEST_PROTOCOL
+            )
+        record = {
+            name: getattr(node, name)
+            for name in JOB_FIELDS + RETRY_STATE_FIELDS
+        }
+        record.update(
+            uid=node.uid, path=path,
+            arguments=pickle.dumps(
+                (node.args, node.kwargs), pickle.HIGHEST_PROTOCOL
+            ),
+            dependencies=[indexes[id(d)] for d in node.dependencies]
+        )
+        records.append(record)
+    return COMPACT_FORMAT + pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+
+
+def load_job(data: bytes) -> Job:
+    if data[:2] == PICKLE_FORMAT:
+        return pickle.loads(data[2:])
+    if data[:2] != COMPACT_FORMAT:
+        return pickle.loads(data)
+    records = pickle.loads(data[2:])
+    nodes: list[Job] = []
+    for record in records:
+        args, kwargs = pickle.loads(record.pop('arguments'))
+        uid = record.pop('uid')
+        node = Job(
+            func=resolve_function(record.pop('path')), args=args,
+            kwargs=kwargs,
+            dependencies=[nodes[i] for i in record.pop('dependencies')],
+            **{name: value for name, value in record.items()
+               if name in JOB_FIELDS}
+        )
+        node.uid = uid
+        for name in RETRY_STATE_FIELDS:
+            setattr(node, name, record[name])
+        nodes.append(node)
+    return nodes[-1]
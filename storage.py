@@ -0,0 +1,729 @@
+import fcntl
+import heapq
+import itertools
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any, BinaryIO
+
+from job import Job
+from serialization import dump_job, load_job
+from utils import scheduler_logger, parse_start_at
+
+
+HANDED_OFF_STATUS = 'handed_off'
+FINAL_STATUSES = ('finished', 'fail', 'cancelled', HANDED_OFF_STATUS)
+CHECKPOINT_PREFIX = '#checkpoint;'
+QUEUED_STATUS = 'queued'
+DEQUEUED_STATUS = 'dequeued'
+LEASE_CLAIMED = 'claimed'
+LEASE_BUSY = 'busy'
+LEASE_MISSING = 'missing'
+
+
+def record_tenant(task: list[str]) -> str:
+    return task[8] if len(task) > 8 else ''
+
+
+class StatusJournal:
+    def __init__(self, snapshot_file: str, compact_every: int = 1000,
+                 final_statuses: tuple[str, ...] = FINAL_STATUSES,
+                 sort_key: Callable[[list[str]], Any] | None = None,
+                 on_load: Callable[[list[list[str]]], None] | None = None,
+                 on_compact: Callable[[], None] | None = None
+                 ) -> None:
+        self.snapshot_file = snapshot_file
+        self.journal_file = snapshot_file + '.journal'
+        self.compact_every = compact_every
+        self.final_statuses = final_statuses
+        self.sort_key = sort_key
+        self.on_load = on_load
+        self.on_compact = on_compact
+        self.records: dict[str, list[str]] = {}
+        self.journal_size = 0
+        self.unread = 0
+        self.touched: set[str] = set()
+        self._seen: set[str] = set()
+        self._reader: BinaryIO | None = None
+        self._sorted_end = 0
+        self._next: list[str] | None = None
+
+    def load(self, lazy: bool = False) -> dict[str, list[str]]:
+        self.records = {}
+        self.journal_size = 0
+        self._close_reader()
+        self._seen = set()
+        sorted_end, count = self._checkpoint() if lazy else (0, 0)
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'rb') as file:
+                file.seek(sorted_end)
+                for task_line in file:
+                    self._apply_line(task_line)
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as file:
+                for task_line in file:
+                    if self._apply_line(task_line):
+                        self.journal_size += 1
+        if sorted_end:
+            self.touched = self._seen
+            self.unread = count
+            self._sorted_end = sorted_end
+            self._reader = open(self.snapshot_file, 'rb')
+            self._reader.readline()
+            self._advance()
+        return self.records
+
+    def peek(self) -> list[str] | None:
+        return self._next
+
+    def load_batch(self, size: int) -> list[list[str]]:
+        tasks: list[list[str]] = []
+        while self._next is not None and len(tasks) < size:
+            task = self._next
+            self.records[task[0]] = task
+            tasks.append(task)
+            self.unread = max(self.unread - 1, 0)
+            self._advance()
+        if tasks and self.on_load is not None:
+            self.on_load(tasks)
+        return tasks
+
+    def load_remaining(self) -> list[list[str]]:
+        tasks = []
+        while self._next is not None:
+            tasks.extend(self.load_batch(10000))
+        return tasks
+
+    def apply(self, task: list[str]) -> None:
+        if self._reader is not None:
+            self.touched.add(task[0])
+        if task[4] in self.final_statuses:
+            self.records.pop(task[0], None)
+        else:
+            self.records[task[0]] = task
+
+    def add(self, task: list[str]) -> None:
+        with open(self.snapshot_file, 'a') as snapshot:
+            snapshot.write(';'.join(task) + '\n')
+        self.apply(task)
+
+    def add_many(self, tasks: list[list[str]], sync: bool = True) -> None:
+        if not tasks:
+            return
+        with open(self.snapshot_file, 'a') as snapshot:
+            snapshot.writelines(';'.join(task) + '\n' for task in tasks)
+            if sync:
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+        for task in tasks:
+            self.apply(task)
+
+    def append(self, task: list[str]) -> None:
+        self.append_many([task])
+
+    def append_many(self, tasks: list[list[str]]) -> None:
+        if not tasks:
+            return
+        with open(self.journal_file, 'a') as journal:
+            journal.writelines(';'.join(task) + '\n' for task in tasks)
+        for task in tasks:
+            self.apply(task)
+        self.journal_size += len(tasks)
+        if self.journal_size >= self.compact_every:
+            self.compact()
+
+    def compact(self) -> None:
+        self.load_remaining()
+        tasks = list(self.records.values())
+        if self.sort_key is not None:
+            tasks.sort(key=self.sort_key)
+        body = ''.join(';'.join(task) + '\n' for task in tasks).encode()
+        header = b''
+        if self.sort_key is not None:
+            sorted_end = len(CHECKPOINT_PREFIX) + 42 + len(body)
+            header = (
+                f'{CHECKPOINT_PREFIX}{len(tasks):020d};{sorted_end:020d}\n'
+            ).encode()
+        tmp_file = self.snapshot_file + '.tmp'
+        with open(tmp_file, 'wb') as snapshot:
+            snapshot.write(header + body)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        with open(self.journal_file, 'w'):
+            pass
+        self.journal_size = 0
+        scheduler_logger.info(
+            f'{self.snapshot_file} compacted, {len(self.records)} records'
+        )
+        if self.on_compact is not None:
+            self.on_compact()
+
+    def _checkpoint(self) -> tuple[int, int]:
+        try:
+            with open(self.snapshot_file, 'rb') as file:
+                header = file.readline().decode()
+        except FileNotFoundError:
+            return 0, 0
+        if not header.startswith(CHECKPOINT_PREFIX):
+            return 0, 0
+        count, sorted_end = header[len(CHECKPOINT_PREFIX):].split(';')
+        return int(sorted_end), int(count)
+
+    def _apply_line(self, task_line: bytes) -> bool:
+        line = task_line.decode().strip()
+        if not line or line.startswith('#'):
+            return False
+        task = line.split(';')
+        self._seen.add(task[0])
+        self.apply(task)
+        return True
+
+    def _advance(self) -> None:
+        self._next = None
+        while self._reader is not None:
+            if self._reader.tell() >= self._sorted_end:
+                self._close_reader()
+                break
+            line = self._reader.readline().decode().strip()
+            if not line or line.startswith('#'):
+                continue
+            task = line.split(';')
+            if task[0] not in self.touched:
+                self._next = task
+                break
+            self.unread = max(self.unread - 1, 0)
+
+    def _close_reader(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = None
+        self._next = None
+        self.unread = 0
+        self.touched = set()
+
+
+class WaitingQueue:
+    def __init__(self, waiting_file: str, aging: float = 0.0,
+                 compact_every: int = 1000, batch_size: int = 1000,
+                 weights: dict[str, float] | None = None) -> None:
+        if any(weight <= 0 for weight in (weights or {}).values()):
+            raise ValueError('Tenant weights must be positive')
+        self.journal = StatusJournal(
+            waiting_file, compact_every, final_statuses=(DEQUEUED_STATUS,),
+            sort_key=self._sort_key, on_load=self._push_many,
+            on_compact=self._forget_dequeued
+        )
+        self.batch_size = batch_size
+        self.aging_rate = aging / 60
+        self.weights = dict(weights or {})
+        self.heaps: dict[str, list[tuple[float, float, int, str]]] = {}
+        self.passes: dict[str, float] = {}
+        self.virtual_time = 0.0
+        self.backlog: dict[str, int] = {}
+        self.dequeued: set[str] = set()
+        self.previous_dequeued: set[str] = set()
+        self.counter = itertools.count()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self.journal.records) + self.journal.unread
+
+    @property
+    def pending(self) -> bool:
+        return self.journal.peek() is not None
+
+    def load(self) -> None:
+        self.heaps, self.backlog = {}, {}
+        for task in self.journal.load(lazy=True).values():
+            self._push(task)
+        self.load_batch()
+        self.loaded = True
+
+    def load_batch(self) -> int:
+        return len(self.journal.load_batch(self.batch_size))
+
+    def push(self, task: list[str]) -> None:
+        task[4] = QUEUED_STATUS
+        self.journal.add(task)
+        self._push(task)
+
+    def push_many(self, tasks: list[list[str]], sync: bool = True) -> None:
+        for task in tasks:
+            task[4] = QUEUED_STATUS
+        self.journal.add_many(tasks, sync)
+        self._push_many(tasks)
+
+    def remove(self, task_uid: str) -> list[str] | None:
+        if task_uid not in self.journal.records and self.pending:
+            self.journal.load_remaining()
+        task = self.journal.records.get(task_uid)
+        if task is None:
+            return None
+        self.journal.append(task[:4] + [DEQUEUED_STATUS])
+        self.dequeued.add(task_uid)
+        self.backlog[record_tenant(task)] -= 1
+        return task
+
+    def apply(self, task: list[str]) -> None:
+        if (task[0] in self.journal.records or task[0] in self.dequeued
+                or task[0] in self.previous_dequeued):
+            return
+        self.journal.apply(task)
+        self._push(task)
+
+    def pop_many(self, count: int) -> list[list[str]]:
+        tasks: list[list[str]] = []
+        popped: set[str] = set()
+        while len(tasks) < count:
+            next_task = self.journal.peek()
+            if next_task is not None and (
+                    not self.heaps or self._sort_key(next_task) <= min(
+                        heap[0][:2] for heap in self.heaps.values())):
+                self.load_batch()
+            if not self.heaps:
+                break
+            tenant = min(self.heaps, key=self._tenant_key)
+            heap = self.heaps[tenant]
+            *_, task_uid = heapq.heappop(heap)
+            if not heap:
+                del self.heaps[tenant]
+            task = self.journal.records.get(task_uid)
+            if task is not None and task_uid not in popped:
+                popped.add(task_uid)
+                tasks.append(task)
+                self.backlog[tenant] -= 1
+                self.virtual_time = self.passes[tenant]
+                self.passes[tenant] += 1 / self.weights.get(tenant, 1.0)
+        self.journal.append_many(
+            [task[:4] + [DEQUEUED_STATUS] for task in tasks]
+        )
+        self.dequeued.update(task[0] for task in tasks)
+        return tasks
+
+    def compact(self) -> None:
+        self.journal.compact()
+
+    def _forget_dequeued(self) -> None:
+        self.previous_dequeued, self.dequeued = self.dequeued, set()
+
+    def _push_many(self, tasks: list[list[str]]) -> None:
+        for task in tasks:
+            self._push(task)
+
+    def _push(self, task: list[str]) -> None:
+        tenant = record_tenant(task)
+        if tenant not in self.heaps:
+            self.heaps[tenant] = []
+            self.passes[tenant] = max(
+                self.passes.get(tenant, 0.0), self.virtual_time
+            )
+        heapq.heappush(self.heaps[tenant], self._heap_item(task))
+        self.backlog[tenant] = self.backlog.get(tenant, 0) + 1
+
+    def _tenant_key(self, tenant: str) -> tuple[float, float, float]:
+        return (self.passes[tenant], *self.heaps[tenant][0][:2])
+
+    def _heap_item(self, task: list[str]) -> tuple[float, float, int, str]:
+        return (*self._sort_key(task), next(self.counter), task[0])
+
+    def _sort_key(self, task: list[str]) -> tuple[float, float]:
+        priority = int(task[5]) if len(task) > 5 else 0
+        enqueued_at = float(task[6]) if len(task) > 6 else 0.0
+        return self.aging_rate * enqueued_at - priority, enqueued_at
+
+
+class FileTaskStore:
+    def __init__(self, tasks_folder: str) -> None:
+        self.tasks_folder = tasks_folder
+        self.due_index: dict[str, tuple[tuple[int, int], float, str]] = {}
+        if not os.path.exists(self.tasks_folder):
+            os.makedirs(self.tasks_folder)
+
+    def save(self, job: Job) -> None:
+        with open(self.tasks_folder + job.uid, 'wb') as task_file:
+            task_file.write(dump_job(job))
+
+    def save_many(self, jobs: list[Job]) -> None:
+        for job in jobs:
+            self.save(job)
+
+    def load(self, task_uid: str) -> Job | None:
+        try:
+            with open(self.tasks_folder + task_uid, 'rb') as task_file:
+                job = load_job(task_file.read())
+        except FileNotFoundError:
+            return None
+        job.completed_dependencies = self._load_dependencies(task_uid)
+        job.dependency_store = self
+        return job
+
+    def delete(self, task_uid: str) -> bool:
+        with self._locked():
+            for file_name in (self._dependencies_file(task_uid),
+                              self._lease_file(task_uid)):
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+            try:
+                os.remove(self.tasks_folder + task_uid)
+                return True
+            except FileNotFoundError:
+                return False
+
+    def record_dependency(self, task_uid: str, node_uid: str,
+                          result: tuple[Any | None, int]) -> None:
+        with open(self._dependencies_file(task_uid), 'ab') as file:
+            pickle.dump((node_uid, result), file)
+
+    def clear_dependencies(self, task_uid: str) -> None:
+        try:
+            os.remove(self._dependencies_file(task_uid))
+        except FileNotFoundError:
+            pass
+
+    def _load_dependencies(self, task_uid: str) -> dict[str, Any]:
+        results: dict[str, Any] = {}
+        try:
+            with open(self._dependencies_file(task_uid), 'rb') as file:
+                while True:
+                    node_uid, result = pickle.load(file)
+                    results[node_uid] = result
+        except (FileNotFoundError, EOFError):
+            pass
+        return results
+
+    def _dependencies_file(self, task_uid: str) -> str:
+        return self.tasks_folder + task_uid + '.deps'
+
+    def claim(self, task_uid: str, owner: str,
+              lease_seconds: float) -> str:
+        with self._locked():
+            if not os.path.exists(self.tasks_folder + task_uid):
+                return LEASE_MISSING
+            holder, expires = self._read_lease(task_uid)
+            if holder != owner and expires > time.time():
+                return LEASE_BUSY
+            self._write_lease(task_uid, owner, lease_seconds)
+        return LEASE_CLAIMED
+
+    def renew(self, owner: str, task_uids: list[str],
+              lease_seconds: float) -> None:
+        with self._locked():
+            for task_uid in task_uids:
+                if self._read_lease(task_uid)[0] == owner:
+                    self._write_lease(task_uid, owner, lease_seconds)
+
+    def release(self, task_uid: str, owner: str) -> None:
+        with self._locked():
+            if self._read_lease(task_uid)[0] == owner:
+                os.remove(self._lease_file(task_uid))
+
+    def defer(self, job: Job, owner: str, due_at: float) -> None:
+        with self._locked():
+            if self._read_lease(job.uid)[0] != owner:
+                return
+            tmp_file = f'{self.tasks_folder}{job.uid}.{owner}.tmp'
+            with open(tmp_file, 'wb') as task_file:
+                task_file.write(dump_job(job))
+            os.replace(tmp_file, self.tasks_folder + job.uid)
+            self._write_lease(job.uid, owner, due_at - time.time())
+
+    def claimable(self, due_before: float,
+                  limit: int) -> list[tuple[str, float, str]]:
+        tasks: list[tuple[str, float, str]] = []
+        now = time.time()
+        with os.scandir(self.tasks_folder) as entries:
+            task_files = sorted(
+                (entry for entry in entries if '.' not in entry.name),
+                key=lambda entry: entry.name
+            )
+        if len(self.due_index) > len(task_files):
+            names = {entry.name for entry in task_files}
+            self.due_index = {
+                task_uid: due for task_uid, due in self.due_index.items()
+                if task_uid in names
+            }
+        for entry in task_files:
+            if len(tasks) >= limit:
+                break
+            if self._read_lease(entry.name)[1] > now:
+                continue
+            due = self._due(entry)
+            if due is not None and due[0] <= due_before:
+                tasks.append((entry.name, *due))
+        return tasks
+
+    def _due(self, entry: os.DirEntry) -> tuple[float, str] | None:
+        try:
+            stat = entry.stat()
+            version = (stat.st_ino, stat.st_mtime_ns)
+            cached = self.due_index.get(entry.name)
+            if cached is None or cached[0] != version:
+                with open(entry.path, 'rb') as task_file:
+                    job = load_job(task_file.read())
+                cached = (
+                    version, parse_start_at(job.start_at), job.func.__name__
+                )
+                self.due_index[entry.name] = cached
+        except FileNotFoundError:
+            return None
+        return cached[1], cached[2]
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        folder = os.open(self.tasks_folder, os.O_RDONLY)
+        try:
+            fcntl.flock(folder, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(folder)
+
+    def _lease_file(self, task_uid: str) -> str:
+        return self.tasks_folder + task_uid + '.lease'
+
+    def _read_lease(self, task_uid: str) -> tuple[str | None, float]:
+        try:
+            with open(self._lease_file(task_uid)) as file:
+                owner, expires = file.read().rsplit(';', 1)
+            return owner, float(expires)
+        except FileNotFoundError:
+            return None, 0.0
+        except ValueError:
+            return None, math.inf
+
+    def _write_lease(self, task_uid: str, owner: str,
+                     lease_seconds: float) -> None:
+        tmp_file = f'{self._lease_file(task_uid)}.{owner}.tmp'
+        with open(tmp_file, 'w') as file:
+            file.write(f'{owner};{time.time() + lease_seconds}')
+        os.replace(tmp_file, self._lease_file(task_uid))
+
+    def set_state(self, task_uid: str, state: str,
+                  attempt: bool = False) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __getstate__(self) -> dict:
+        return {'tasks_folder': self.tasks_folder}
+
+    def __setstate__(self, state: dict) -> None:
+        self.tasks_folder = state['tasks_folder']
+        self.due_index = {}
+
+
+class SQLiteTaskStore:
+    def __init__(self, database: str) -> None:
+        self.database = database
+        self._local = threading.local()
+        self._create_schema()
+
+    def save(self, job: Job) -> None:
+        self.save_many([job])
+
+    def save_many(self, jobs: list[Job]) -> None:
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO tasks '
+                '(uid, state, start_at, func_name, attempts, body) '
+                'VALUES (?, ?, ?, ?, 0, ?)',
+                [(job.uid, 'wait', parse_start_at(job.start_at),
+                  job.func.__name__, dump_job(job)) for job in jobs]
+            )
+
+    def load(self, task_uid: str) -> Job | None:
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT body FROM tasks WHERE uid = ?', (task_uid,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = load_job(row[0])
+        job.completed_dependencies = {
+            node_uid: pickle.loads(result)
+            for node_uid, result in connection.execute(
+                'SELECT node_uid, result FROM dependency_results '
+                'WHERE task_uid = ?', (task_uid,)
+            )
+        }
+        job.dependency_store = self
+        return job
+
+    def delete(self, task_uid: str) -> bool:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'DELETE FROM dependency_results WHERE task_uid = ?',
+                (task_uid,)
+            )
+            cursor = connection.execute(
+                'DELETE FROM tasks WHERE uid = ?', (task_uid,)
+            )
+        return cursor.rowcount > 0
+
+    def record_dependency(self, task_uid: str, node_uid: str,
+                          result: tuple[Any | None, int]) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO dependency_results '
+                '(task_uid, node_uid, result) VALUES (?, ?, ?)',
+                (task_uid, node_uid, pickle.dumps(result))
+            )
+
+    def clear_dependencies(self, task_uid: str) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'DELETE FROM dependency_results WHERE task_uid = ?',
+                (task_uid,)
+            )
+
+    def set_state(self, task_uid: str, state: str,
+                  attempt: bool = False) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'UPDATE tasks SET state = ?, attempts = attempts + ?, '
+                'updated_at = ? WHERE uid = ?',
+                (state, int(attempt), time.time(), task_uid)
+            )
+
+    def claim(self, task_uid: str, owner: str,
+              lease_seconds: float) -> str:
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            cursor = connection.execute(
+                'UPDATE tasks SET lease_owner = ?, lease_expires = ? '
+                'WHERE uid = ? AND (lease_owner IS NULL OR lease_owner = ? '
+                'OR lease_expires < ?)',
+                (owner, now + lease_seconds, task_uid, owner, now)
+            )
+            if cursor.rowcount:
+                return LEASE_CLAIMED
+            exists = connection.execute(
+                'SELECT 1 FROM tasks WHERE uid = ?', (task_uid,)
+            ).fetchone()
+        return LEASE_BUSY if exists else LEASE_MISSING
+
+    def renew(self, owner: str, task_uids: list[str],
+              lease_seconds: float) -> None:
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                'UPDATE tasks SET lease_expires = ? '
+                'WHERE uid = ? AND lease_owner = ?',
+                [(time.time() + lease_seconds, task_uid, owner)
+                 for task_uid in task_uids]
+            )
+
+    def release(self, task_uid: str, owner: str) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'UPDATE tasks SET lease_owner = NULL, lease_expires = NULL '
+                'WHERE uid = ? AND lease_owner = ?', (task_uid, owner)
+            )
+
+    def defer(self, job: Job, owner: str, due_at: float) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'UPDATE tasks SET state = ?, start_at = ?, body = ?, '
+                'lease_expires = ?, updated_at = ? '
+                'WHERE uid = ? AND lease_owner = ?',
+                ('wait', due_at, dump_job(job), due_at, time.time(),
+                 job.uid, owner)
+            )
+
+    def claimable(self, due_before: float,
+                  limit: int) -> list[tuple[str, float, str]]:
+        rows = self._connection().execute(
+            'SELECT uid, start_at, func_name FROM tasks '
+            'WHERE start_at <= ? AND (lease_owner IS NULL '
+            'OR lease_expires < ?) ORDER BY start_at LIMIT ?',
+            (due_before, time.time(), limit)
+        )
+        return [tuple(row) for row in rows]
+
+    def find(self, state: str | None = None,
+             func_name: str | None = None,
+             due_before: float | None = None) -> list[str]:
+        conditions: list[str] = []
+        params: list[Any] = []
+        if state is not None:
+            conditions.append('state = ?')
+            params.append(state)
+        if func_name is not None:
+            conditions.append('func_name = ?')
+            params.append(func_name)
+        if due_before is not None:
+            conditions.append('start_at <= ?')
+            params.append(due_before)
+        query = 'SELECT uid FROM tasks'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        rows = self._connection().execute(query + ' ORDER BY start_at',
+                                          params)
+        return [row[0] for row in rows]
+
+    def attempts(self, task_uid: str) -> int:
+        row = self._connection().execute(
+            'SELECT attempts FROM tasks WHERE uid = ?', (task_uid,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.database, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_schema(self) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS tasks ('
+                'uid TEXT PRIMARY KEY, state TEXT NOT NULL, '
+                'start_at REAL NOT NULL DEFAULT 0, func_name TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'updated_at REAL, body BLOB NOT NULL, '
+                'lease_owner TEXT, lease_expires REAL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS dependency_results ('
+                'task_uid TEXT NOT NULL, node_uid TEXT NOT NULL, '
+                'result BLOB NOT NULL, PRIMARY KEY (task_uid, node_uid))'
+            )
+            for column in ('state', 'start_at', 'func_name', 'attempts',
+                           'lease_expires'):
+                connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS tasks_{column} '
+                    f'ON tasks ({column})'
+                )
+
+    def __getstate__(self) -> dict:
+        return {'database': self.database}
+
+    def __setstate__(self, state: dict) -> None:
+        self.database = state['database']
+        self._local = threading.local()
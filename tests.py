@@ -1,11 +1,112 @@
+import asyncio
+import json
+import pickle
+import pstats
+import subprocess
+import sys
+import threading
 import time
 import unittest
 import os
 
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Queue
+from typing import Any
+from unittest import mock
+
+from cache import ResultCache
+from channel import SchedulerClient
+from dag import assign_uids
+from deadlines import deadline, monitor
+from exceptions import (
+    DependencyCycleException, HttpStatusException, StopExecution,
+    TenantBacklogException, WorkingTimeoutException
+)
+from handoff import ResultHandle, SharedResultStore
+from http_jobs import (
+    STALE_CONNECTION_ERRORS, ConnectionPool, HttpJob, default_pool
+)
 from job import Job
+from limits import ResourceLimiter, TokenBucket
+from logs import QueuedFileHandler, writer
+from metrics import Histogram, Metrics
+from pipeline import STREAM_BATCH_SIZE, STREAM_BUFFER_SIZE
+from profiling import Profiler
+from retry import RetryPolicy
 from scheduler import Scheduler
+from schedules import CronSchedule, IntervalSchedule
+from serialization import PICKLE_FORMAT, dump_job, load_job
+from storage import (
+    LEASE_BUSY, LEASE_CLAIMED, LEASE_MISSING, FileTaskStore,
+    SQLiteTaskStore, StatusJournal, WaitingQueue
+)
 from examples import file_system, files, requests
-from utils import is_valid_uuid
+from utils import config_logger, is_valid_uuid, START_AT_FORMAT
+
+
+async def async_sleep(seconds: float) -> str:
+    await asyncio.sleep(seconds)
+    return 'done'
+
+
+async def async_users() -> list[dict]:
+    return [{'name': 'async 1'}, {'name': 'async 2'}]
+
+
+calls: list[str] = []
+
+
+def sleep_and_return(name: str, seconds: float = 0.0) -> str:
+    calls.append(name)
+    time.sleep(seconds)
+    return name
+
+
+def join_names(**kwargs) -> str:
+    return ','.join(sorted(kwargs.values()))
+
+
+def fail_once() -> str:
+    if 'fail_once' not in calls:
+        calls.append('fail_once')
+        raise ValueError('first attempt')
+    return 'ok'
+
+
+def append_line(file_name: str, line: str, fail_first: bool = False) -> None:
+    with open(file_name, 'a') as file:
+        file.write(f'{line} {time.time()}\n')
+    with open(file_name, 'r') as file:
+        if fail_first and file.read().count(line) < 2:
+            raise ValueError(f'{line} failed')
+
+
+def append_and_fail(file_name: str, line: str) -> None:
+    append_line(file_name, line)
+    raise ValueError(f'{line} failed')
+
+
+def record_span(file_name: str, line: str, seconds: float = 0.0) -> None:
+    started = time.time()
+    spin(seconds)
+    with open(file_name, 'a') as file:
+        file.write(f'{line} {started} {time.time()}\n')
+
+
+def busy_wait(seconds: float) -> str:
+    finish = time.perf_counter() + seconds
+    while time.perf_counter() < finish:
+        pass
+    return 'done'
+
+
+def spin(seconds: float) -> str:
+    finish = time.monotonic() + seconds
+    while time.monotonic() < finish:
+        time.sleep(0.01)
+    return 'done'
 
 
 class JobTest(unittest.TestCase):
@@ -38,6 +139,99 @@ class JobTest(unittest.TestCase):
             result
         )
 
+    def test_sub_second_timeout(self) -> None:
+        job = Job(func=time.sleep, args=[5], max_working_time=0.3)
+        started = time.monotonic()
+
+        self.assertIsNone(job.run())
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_timeouts_in_worker_threads(self) -> None:
+        slow = Job(func=spin, args=[5], max_working_time=0.3)
+        fast = Job(func=spin, args=[0.6], max_working_time=2)
+        started = time.monotonic()
+        with ThreadPoolExecutor(2) as pool:
+            results = list(pool.map(Job.run, [slow, fast]))
+
+        self.assertEqual(results, [None, ('done', 1)])
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_stream_dependencies(self) -> None:
+        produced = consumed = lead = 0
+
+        def numbers(count: int):
+            nonlocal produced
+            for number in range(count):
+                produced += 1
+                yield number
+
+        def double(data):
+            for number in data:
+                yield number * 2
+
+        def total(data) -> int:
+            nonlocal consumed, lead
+            result = 0
+            for number in data:
+                consumed += 1
+                lead = max(lead, produced - consumed)
+                result += number
+            return result
+
+        job = Job(
+            func=total, dependency_mode='stream',
+            dependencies=[
+                Job(func=numbers, args=[100_000], return_arg='data'),
+                Job(func=double, return_arg='data')
+            ]
+        )
+
+        self.assertEqual(job.run(), (99_999 * 100_000, 1))
+        self.assertLessEqual(
+            lead, 2 * (STREAM_BUFFER_SIZE + 2) * STREAM_BATCH_SIZE
+        )
+        self.assertEqual(job.kwargs, {})
+        self.assertEqual(job.dependencies[1].kwargs, {})
+
+    def test_stream_failure(self) -> None:
+        def broken():
+            yield 'first'
+            raise ValueError('broken stream')
+
+        def collect(data) -> list:
+            return list(data)
+
+        job = Job(
+            func=collect, dependency_mode='stream',
+            dependencies=[Job(func=broken, return_arg='data')]
+        )
+
+        self.assertIsNone(job.run())
+        self.assertEqual(job.last_error, 'ValueError')
+        self.assertEqual(job.kwargs, {})
+
+    def test_stream_files(self) -> None:
+        file_system.create_directory(self.directory_name)
+        source = self.directory_name + 'source.txt'
+        with open(source, 'w') as file:
+            file.writelines(f'row {i} of foo\n' for i in range(10_000))
+        job = Job(
+            func=files.write_to_file,
+            args=[self.directory_name + 'updated.txt'],
+            dependency_mode='stream',
+            dependencies=[
+                Job(func=files.read_lines, args=[source], return_arg='data'),
+                Job(func=files.update_lines, return_arg='data')
+            ]
+        )
+
+        self.assertEqual(job.run(), (None, 1))
+        with open(source) as file:
+            expected = files.update_data(file.readlines())
+        with open(self.directory_name + 'updated.txt') as file:
+            self.assertEqual(file.readlines(), expected)
+        self.assertIsInstance(pickle.loads(pickle.dumps(job)), Job)
+
     def test_planned_task(self) -> None:
         job = Job(
             func=requests.get_data,
@@ -103,18 +297,216 @@ class JobTest(unittest.TestCase):
             result
         )
 
+    def test_async_task(self) -> None:
+        job = Job(func=async_sleep, args=[0.1])
+
+        self.assertEqual(job.run(), ('done', 1))
+        self.assertEqual(asyncio.run(job.run_async()), ('done', 1))
+
+    def test_too_long_async_task(self) -> None:
+        job = Job(func=async_sleep, args=[5], max_working_time=1)
+        started = time.monotonic()
+
+        self.assertIsNone(asyncio.run(job.run_async()))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_mixed_sync_and_async_dependencies(self) -> None:
+        dep_job = Job(func=async_users, return_arg='users')
+        names_job = Job(
+            func=requests.get_user_names,
+            return_arg='data'
+        )
+        job = Job(
+            func=files.update_data,
+            dependencies=[dep_job, names_job]
+        )
+        expected = (['ASYNC 1\n', 'ASYNC 2\n'], 1)
+
+        self.assertEqual(job.run(), expected)
+        self.assertEqual(asyncio.run(job.run_async()), expected)
+
+    def test_graph_dependencies_run_in_parallel(self) -> None:
+        calls.clear()
+        job = Job(
+            func=join_names,
+            dependencies=[
+                Job(func=sleep_and_return, args=['a', 1], return_arg='a'),
+                Job(func=sleep_and_return, args=['b', 1], return_arg='b')
+            ],
+            dependency_mode='graph'
+        )
+        started = time.monotonic()
+
+        self.assertEqual(job.run(), ('a,b', 1))
+        self.assertLess(time.monotonic() - started, 1.8)
+
+    def test_shared_dependency_runs_once(self) -> None:
+        calls.clear()
+        shared = Job(func=sleep_and_return, args=['shared'])
+        job = Job(
+            func=join_names,
+            dependencies=[
+                Job(func=sleep_and_return, args=['left'],
+                    dependencies=[shared], return_arg='left'),
+                Job(func=sleep_and_return, args=['right'],
+                    dependencies=[shared], return_arg='right')
+            ],
+            dependency_mode='graph'
+        )
+
+        self.assertEqual(job.run(), ('left,right', 1))
+        self.assertEqual(calls.count('shared'), 1)
+
+    def test_failed_shared_dependency_releases_waiters(self) -> None:
+        class BrokenStore:
+            def record_dependency(self, *args) -> None:
+                raise OSError('disk full')
+
+        shared = Job(func=sleep_and_return, args=['shared', 0.2])
+        job = Job(
+            func=join_names,
+            dependencies=[
+                Job(func=sleep_and_return, args=['left'],
+                    dependencies=[shared], return_arg='left'),
+                Job(func=sleep_and_return, args=['right'],
+                    dependencies=[shared], return_arg='right')
+            ],
+            dependency_mode='graph'
+        )
+        job.uid = 'task'
+        job.dependency_store = BrokenStore()
+        results = []
+        runner = threading.Thread(
+            target=lambda: results.append(job.run()), daemon=True
+        )
+        runner.start()
+        runner.join(5)
+
+        self.assertEqual(results, [None])
+
+    def test_graph_deadline_does_not_wait_for_dependencies(self) -> None:
+        job = Job(
+            func=join_names,
+            dependencies=[
+                Job(func=spin, args=[1], return_arg='a'),
+                Job(func=spin, args=[1], return_arg='b')
+            ],
+            dependency_mode='graph', max_working_time=0.2
+        )
+        started = time.monotonic()
+
+        self.assertIsNone(job.run())
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_completed_dependency_is_not_rerun(self) -> None:
+        calls.clear()
+        job = Job(
+            func=fail_once,
+            dependencies=[Job(func=sleep_and_return, args=['dep'])],
+            tries=2
+        )
+
+        self.assertEqual(job.run(), ('ok', 1))
+        self.assertEqual(calls.count('dep'), 1)
+
+    def test_retry_policy(self) -> None:
+        policy = RetryPolicy(delay=1, max_delay=3)
+        jitter = RetryPolicy(kind='jitter', delay=1, max_delay=3)
+
+        self.assertEqual(
+            [policy.next_delay(attempt) for attempt in (1, 2, 3)], [1, 2, 3]
+        )
+        self.assertTrue(1 <= jitter.next_delay(1, 2) <= 3)
+
+        calls.clear()
+        job = Job(
+            func=fail_once, tries=3,
+            retry_policy=RetryPolicy(kind='fixed', delay=5)
+        )
+        self.assertEqual(job.run(defer_retries=True), (5, 2))
+        self.assertEqual(job.run(defer_retries=True), ('ok', 1))
+
+        calls.clear()
+        job = Job(
+            func=fail_once, tries=3,
+            retry_policy=RetryPolicy(retry_on=(TypeError,))
+        )
+        self.assertIsNone(job.run())
+
+    def test_dependency_cycle(self) -> None:
+        first = Job(func=requests.example_str_foo)
+        second = Job(func=requests.example_str_foo, dependencies=[first])
+        first.dependencies.append(second)
+
+        with self.assertRaises(DependencyCycleException):
+            Job(func=requests.example_str_foo, dependencies=[first]).run()
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_concurrent_deadlines_do_not_deadlock(self) -> None:
+        outcomes: list[str] = []
+
+        def run_deadlines() -> None:
+            for index in range(1000):
+                try:
+                    with deadline(0.0005):
+                        busy_wait(index % 3 * 0.0005)
+                    outcomes.append('done')
+                except WorkingTimeoutException:
+                    outcomes.append('timeout')
+
+        threads = [threading.Thread(target=run_deadlines, daemon=True)
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        run_deadlines()
+        for thread in threads:
+            thread.join(60)
+
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(len(outcomes), 5000)
+        self.assertEqual(monitor.active, {})
+        self.assertEqual(monitor.busy, set())
+
+    def test_job_timeouts_in_thread_pool(self) -> None:
+        jobs = [Job(func=busy_wait, args=[index % 3 * 0.001],
+                    max_working_time=0.001) for index in range(1000)]
+        pool = ThreadPoolExecutor(4)
+        futures = [pool.submit(job.run) for job in jobs]
+        _, not_done = wait(futures, timeout=60)
+        pool.shutdown(wait=False)
+
+        self.assertEqual(not_done, set())
+        self.assertTrue(all(future.result() in (None, ('done', 1))
+                            for future in futures))
+        self.assertEqual(monitor.active, {})
+
 
 class SchedulerTest(unittest.TestCase):
     tasks_folder = './test_tasks/'
     statuses_file = 'test_statuses.txt'
     waiting_tasks_file = 'test_waiting_file.txt'
+    database = 'test_tasks.db'
+    retry_file = 'test_retry.txt'
+    metrics_file = 'test_metrics.json'
 
     def tearDown(self) -> None:
         file_system.delete_directory_with_files(self.tasks_folder)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
         if os.path.exists(self.statuses_file):
             os.remove(self.statuses_file)
+        if os.path.exists(self.statuses_file + '.journal'):
+            os.remove(self.statuses_file + '.journal')
         if os.path.exists(self.waiting_tasks_file):
             os.remove(self.waiting_tasks_file)
+        if os.path.exists(self.waiting_tasks_file + '.journal'):
+            os.remove(self.waiting_tasks_file + '.journal')
+        if os.path.exists(self.retry_file):
+            os.remove(self.retry_file)
+        if os.path.exists(self.metrics_file):
+            os.remove(self.metrics_file)
 
     def test_schedule_task(self) -> None:
         sh = Scheduler(
@@ -204,6 +596,1303 @@ class SchedulerTest(unittest.TestCase):
         result = sh.run(uid)
         self.assertEqual(result, ('Test result data', 1))
 
+    def test_idle_scheduler_sleeps_until_start_time(self) -> None:
+        sh = Scheduler(
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file
+        )
+        sh.schedule(Job(
+            func=requests.get_data,
+            start_at='20-12-2099 15:10:00'
+        ))
+        run_coroutine = sh._run_coroutine()
+        timeout = run_coroutine.send(None)
+        self.assertGreaterEqual(timeout, 3600)
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 1)
+
+    def test_deferred_task_starts_on_time(self) -> None:
+        sh = Scheduler(
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file
+        )
+        start_at = datetime.now() + timedelta(seconds=2)
+        sh.schedule(Job(
+            func=requests.example_str_foo,
+            start_at=start_at.strftime(START_AT_FORMAT)
+        ))
+        sh.start()
+        time.sleep(1)
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 1)
+        time.sleep(2)
+        sh.stop()
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 0)
+
+    def _run_parallel_sleeps(self, execution_mode: str) -> None:
+        sh = Scheduler(
+            pool_size=4,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            execution_mode=execution_mode
+        )
+        for _ in range(4):
+            sh.schedule(Job(func=time.sleep, args=[1.5]))
+        sh.start()
+        time.sleep(2.5)
+        sh.stop()
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 0)
+
+    def test_thread_pool_runs_tasks_in_parallel(self) -> None:
+        self._run_parallel_sleeps('thread')
+
+    def test_process_pool_runs_tasks_in_parallel(self) -> None:
+        self._run_parallel_sleeps('process')
+
+    def test_asyncio_mode_overlaps_coroutines(self) -> None:
+        sh = Scheduler(
+            pool_size=50,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            execution_mode='asyncio'
+        )
+        for _ in range(50):
+            sh.schedule(Job(func=async_sleep, args=[1]))
+        sh.start()
+        time.sleep(2)
+        sh.stop()
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 0)
+
+    def test_scheduler_with_sqlite_store(self) -> None:
+        store = SQLiteTaskStore(self.database)
+        sh = Scheduler(
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            task_store=store
+        )
+        sh.schedule(Job(func=requests.example_str_foo))
+        sh.schedule(Job(func=file_system.error_func))
+        uid = store.find(func_name='example_str_foo')[0]
+
+        self.assertEqual(len(store.find()), 2)
+        self.assertEqual(sh.run(uid), ('Test result data', 1))
+        self.assertEqual(
+            store.find(), store.find(func_name='error_func')
+        )
+        self.assertFalse(os.path.exists(self.tasks_folder + uid))
+
+    def test_retry_frees_the_slot(self) -> None:
+        sh = Scheduler(
+            pool_size=2,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file
+        )
+        sh.schedule(Job(
+            func=append_line, args=[self.retry_file, 'flaky', True],
+            tries=2, retry_policy=RetryPolicy(kind='fixed', delay=1)
+        ))
+        sh.schedule(Job(func=append_line, args=[self.retry_file, 'other']))
+        sh.start()
+        time.sleep(2.5)
+        sh.stop()
+
+        with open(self.retry_file, 'r') as file:
+            lines = [line.split() for line in file]
+        flaky = [float(ts) for name, ts in lines if name == 'flaky']
+        self.assertEqual(len(flaky), 2)
+        self.assertEqual(lines[-1][0], 'flaky')
+        self.assertGreater(flaky[1] - flaky[0], 0.9)
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 0)
+
+    def test_schedule_many(self) -> None:
+        for store in ('file', 'sqlite'):
+            task_store = (
+                SQLiteTaskStore(self.database) if store == 'sqlite' else None
+            )
+            sh = Scheduler(
+                pool_size=2,
+                tasks_folder=self.tasks_folder,
+                statuses_file=self.statuses_file,
+                waiting_tasks_file=self.waiting_tasks_file,
+                task_store=task_store
+            )
+            self.assertEqual(
+                sh.schedule_many(
+                    [Job(func=spin, args=[0]), 'not a job']  # type: ignore
+                ), []
+            )
+            uids = sh.schedule_many(
+                [Job(func=spin, args=[0], priority=i) for i in range(5)]
+            )
+
+            self.assertEqual(len(uids), 5)
+            self.assertTrue(all(is_valid_uuid(uid) for uid in uids))
+            self.assertEqual(len(sh.statuses.load()), 2)
+            self.assertEqual(len(sh.waiting.journal.load()), 3)
+            self.assertEqual(sh.current_count_tasks.value, 2)
+            self.assertIsNotNone(sh.task_store.load(uids[-1]))
+
+            sh.start()
+            time.sleep(1)
+            sh.stop()
+            self.assertEqual(len(sh.statuses.load()), 0)
+            self.assertEqual(len(sh.waiting.journal.load()), 0)
+            self.tearDown()
+
+    def test_restart_drains_compacted_backlog(self) -> None:
+        settings: dict[str, Any] = dict(
+            pool_size=2,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            compact_every=5
+        )
+        sh = Scheduler(**settings)
+        for index in range(30):
+            sh.schedule(
+                Job(func=append_line, args=[self.retry_file, f'job-{index}'])
+            )
+        sh.waiting.compact()
+
+        restarted = Scheduler(**settings)
+        restarted.waiting.batch_size = 4
+        restarted.start()
+        time.sleep(2)
+        restarted.stop()
+
+        with open(self.retry_file, 'r') as file:
+            lines = sorted(line.split()[0] for line in file)
+        self.assertEqual(lines, sorted(f'job-{i}' for i in range(30)))
+        self.assertEqual(len(restarted.waiting), 0)
+        self.assertEqual(os.listdir(self.tasks_folder), [])
+
+    def test_shared_store_runs_each_task_once(self) -> None:
+        os.makedirs(self.tasks_folder)
+        schedulers = [
+            Scheduler(
+                pool_size=4,
+                tasks_folder=self.tasks_folder,
+                statuses_file=prefix + self.statuses_file,
+                waiting_tasks_file=prefix + self.waiting_tasks_file,
+                task_store=SQLiteTaskStore(self.database),
+                lease_seconds=1, poll_interval=0.1
+            ) for prefix in ('', self.tasks_folder)
+        ]
+        uids = schedulers[0].schedule_many([
+            Job(func=append_line, args=[self.retry_file, f'job-{i}'])
+            for i in range(6)
+        ])
+        schedulers[0].task_store.claim(uids[0], 'crashed', 0.5)
+        for sh in reversed(schedulers):
+            sh.queue = Queue()
+            sh.start()
+            time.sleep(0.3)
+        time.sleep(2)
+        for sh in schedulers:
+            sh.stop()
+
+        with open(self.retry_file, 'r') as file:
+            lines = sorted(line.split()[0] for line in file)
+        self.assertEqual(lines, [f'job-{i}' for i in range(6)])
+        self.assertEqual(SQLiteTaskStore(self.database).find(), [])
+
+    def test_shared_store_keeps_retry_backoff(self) -> None:
+        os.makedirs(self.tasks_folder)
+        schedulers = [
+            Scheduler(
+                pool_size=2,
+                tasks_folder=self.tasks_folder,
+                statuses_file=prefix + self.statuses_file,
+                waiting_tasks_file=prefix + self.waiting_tasks_file,
+                task_store=SQLiteTaskStore(self.database),
+                lease_seconds=1, poll_interval=0.1
+            ) for prefix in ('', self.tasks_folder)
+        ]
+        schedulers[0].schedule(Job(
+            func=append_and_fail, args=[self.retry_file, 'flaky'],
+            tries=3, retry_policy=RetryPolicy(kind='fixed', delay=1)
+        ))
+        for sh in schedulers:
+            sh.queue = Queue()
+            sh.start()
+        time.sleep(3.5)
+        for sh in schedulers:
+            sh.stop()
+
+        with open(self.retry_file, 'r') as file:
+            runs = [float(line.split()[1]) for line in file]
+        self.assertEqual(len(runs), 3)
+        self.assertGreater(min(b - a for a, b in zip(runs, runs[1:])), 0.9)
+        self.assertEqual(SQLiteTaskStore(self.database).find(), [])
+
+    def test_resource_limits(self) -> None:
+        sh = Scheduler(
+            pool_size=8,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            execution_mode='thread',
+            resource_limits={'cpu': 1},
+            rate_limits={'host': 2}
+        )
+        for name in ('cpu-1', 'cpu-2', 'net', 'host-1', 'host-2', 'host-3'):
+            sh.schedule(Job(
+                func=record_span,
+                args=[self.retry_file, name, 0.5 if 'cpu' in name else 0],
+                resources=[name.split('-')[0]] if '-' in name else None
+            ))
+        sh.start()
+        time.sleep(2)
+        sh.stop()
+
+        with open(self.retry_file, 'r') as file:
+            spans = {
+                name: (float(started), float(finished))
+                for name, started, finished in map(str.split, file)
+            }
+        self.assertEqual(len(spans), 6)
+        first_cpu, second_cpu = sorted([spans['cpu-1'], spans['cpu-2']])
+        self.assertGreaterEqual(second_cpu[0], first_cpu[1])
+        self.assertLess(spans['net'][0], first_cpu[1])
+        host_starts = sorted(spans[f'host-{i}'][0] for i in (1, 2, 3))
+        self.assertLess(host_starts[1] - host_starts[0], 0.1)
+        self.assertGreater(host_starts[2] - host_starts[0], 0.4)
+
+    def test_scheduled_jobs_share_result_cache(self) -> None:
+        calls.clear()
+        cache = ResultCache()
+        sh = Scheduler(
+            pool_size=1,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            execution_mode='thread',
+            result_cache=cache
+        )
+        for _ in range(3):
+            sh.schedule(Job(func=sleep_and_return, args=['cached'],
+                            cache_ttl=60))
+        runner = threading.Thread(target=sh.run)
+        runner.start()
+        while sh.current_count_tasks.value > 0:  # type: ignore
+            time.sleep(0.01)
+        sh.queue.put(StopExecution)
+        runner.join()
+
+        self.assertEqual(calls.count('cached'), 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_producer_exits_after_scheduling(self) -> None:
+        script = (
+            'from examples.requests import get_data\n'
+            'from job import Job\n'
+            'from scheduler import Scheduler\n'
+            f'sh = Scheduler(pool_size=1, tasks_folder={self.tasks_folder!r},'
+            f' statuses_file={self.statuses_file!r},'
+            f' waiting_tasks_file={self.waiting_tasks_file!r})\n'
+            'for _ in range(3000):\n'
+            '    sh.schedule(Job(get_data))\n'
+            'sh.schedule_many([Job(get_data) for _ in range(2000)])\n'
+        )
+        completed = subprocess.run(
+            [sys.executable, '-c', script], timeout=60
+        )
+
+        self.assertEqual(completed.returncode, 0)
+
+    def test_weighted_tenants_and_backlog_limit(self) -> None:
+        sh = Scheduler(
+            pool_size=1,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            execution_mode='thread',
+            metrics_file=self.metrics_file,
+            tenant_weights={'small': 3},
+            tenant_backlog={'bulk': 4}
+        )
+        for index in range(5):
+            sh.schedule(Job(func=record_span, tenant='bulk',
+                            args=[self.retry_file, f'bulk-{index}']))
+        with self.assertRaises(TenantBacklogException):
+            sh.schedule(Job(func=record_span, tenant='bulk',
+                            args=[self.retry_file, 'bulk-5']))
+        for index in range(2):
+            sh.schedule(Job(func=record_span, tenant='small',
+                            args=[self.retry_file, f'small-{index}']))
+        sh.start()
+        time.sleep(1)
+        sh.stop()
+
+        with open(self.retry_file, 'r') as file:
+            names = [line.split()[0] for line in file]
+        with open(self.metrics_file, 'r') as file:
+            functions = json.load(file)['functions']
+        self.assertEqual(names, [
+            'bulk-0', 'bulk-1', 'small-0', 'small-1', 'bulk-2', 'bulk-3',
+            'bulk-4'
+        ])
+        self.assertEqual(
+            functions['tenant:small']['queue_wait_seconds']['count'], 2
+        )
+
+    def test_backlog_limit_survives_restart(self) -> None:
+        settings: dict[str, Any] = dict(
+            pool_size=1,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            tenant_backlog={'a': 2}
+        )
+        sh = Scheduler(**settings)
+        for index in range(3):
+            sh.schedule(Job(func=spin, args=[0], tenant='a'))
+
+        restarted = Scheduler(**settings)
+        with self.assertRaises(TenantBacklogException):
+            restarted.schedule(Job(func=spin, args=[0], tenant='a'))
+        restarted.start()
+        time.sleep(1)
+        restarted.stop()
+        self.assertIsNotNone(
+            restarted.schedule(Job(func=spin, args=[0], tenant='a'))
+        )
+
+    def test_recurring_task(self) -> None:
+        sh = Scheduler(
+            pool_size=1,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file
+        )
+        uid = sh.schedule(Job(
+            func=append_line, args=[self.retry_file, 'tick'],
+            schedule=IntervalSchedule(0.5, count=3)
+        ))
+        assert uid is not None
+        sh.schedule(Job(func=append_line, args=[self.retry_file, 'once']))
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 2)
+        self.assertEqual(sh.statuses.records[uid][7], '0')
+        sh.start()
+        time.sleep(2)
+        sh.stop()
+
+        with open(self.retry_file, 'r') as file:
+            lines = [line.split() for line in file]
+        ticks = [float(ts) for name, ts in lines if name == 'tick']
+        self.assertEqual(len(ticks), 3)
+        self.assertTrue(all(
+            later - earlier > 0.4 for earlier, later in zip(ticks, ticks[1:])
+        ))
+        self.assertEqual(len(sh.statuses.load()), 0)
+        self.assertFalse(os.path.exists(self.tasks_folder + uid))
+
+    def test_file_store_leases(self) -> None:
+        store = FileTaskStore(self.tasks_folder)
+        job = Job(func=spin, args=[0])
+        job.uid = 'task-1'
+        store.save(job)
+
+        self.assertEqual(store.claim('task-1', 'a', 0.2), LEASE_CLAIMED)
+        self.assertEqual(store.claim('task-1', 'b', 0.2), LEASE_BUSY)
+        self.assertEqual(store.claimable(time.time(), 10), [])
+        time.sleep(0.3)
+        self.assertEqual(
+            [uid for uid, _, _ in store.claimable(time.time(), 10)],
+            ['task-1']
+        )
+        self.assertEqual(store.claim('task-1', 'b', 10), LEASE_CLAIMED)
+        store.release('task-1', 'a')
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_BUSY)
+        store.release('task-1', 'b')
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_CLAIMED)
+        with open(store._lease_file('task-1'), 'w') as file:
+            file.write('torn')
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_BUSY)
+        self.assertEqual(store.claimable(time.time(), 10), [])
+        os.remove(store._lease_file('task-1'))
+        store.claim('task-1', 'a', 10)
+        store.defer(job, 'a', time.time() + 0.2)
+        self.assertEqual(store.claim('task-1', 'b', 10), LEASE_BUSY)
+        time.sleep(0.3)
+        self.assertEqual(store.claim('task-1', 'b', 10), LEASE_CLAIMED)
+        store.defer(job, 'a', time.time())
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_BUSY)
+        store.delete('task-1')
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_MISSING)
+        self.assertEqual(os.listdir(self.tasks_folder), [])
+
+    def test_channel_submit_cancel_query(self) -> None:
+        sh = Scheduler(
+            pool_size=1,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file
+        )
+        sh.start()
+        deferred = sh.schedule(Job(
+            func=spin, args=[0], start_at='20-12-2099 15:10:00'
+        ))
+        queued = sh.schedule(Job(func=spin, args=[0]))
+        assert deferred is not None and queued is not None
+        started = time.perf_counter()
+        for _ in range(100):
+            sh.query(deferred)
+        round_trip = (time.perf_counter() - started) / 100
+
+        self.assertNotIn(deferred, sh.statuses.records)
+        self.assertEqual(sh.query(deferred), 'wait')
+        self.assertEqual(sh.query(queued), 'queued')
+        self.assertTrue(sh.cancel(deferred))
+        self.assertEqual(sh.query(deferred), 'cancelled')
+        self.assertFalse(sh.cancel(deferred))
+        time.sleep(0.5)
+        self.assertEqual(sh.query(queued), 'finished')
+        self.assertIsNone(sh.query('unknown'))
+        sh.stop()
+
+        self.assertLess(round_trip, 0.005)
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 0)
+        self.assertEqual(len(sh.statuses.load()), 0)
+
+    def test_channel_survives_restart(self) -> None:
+        sh = Scheduler(
+            pool_size=1,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file
+        )
+        sh.start()
+        first = sh.schedule(Job(func=spin, args=[0]))
+        assert first is not None
+        with self.assertRaises(Exception):
+            SchedulerClient(sh.address).query(first)
+        self.assertIsNotNone(sh.query(first))
+        sh.stop()
+        sh.start()
+        second = sh.schedule(Job(func=spin, args=[0]))
+        assert second is not None
+        time.sleep(0.5)
+        self.assertEqual(sh.query(second), 'finished')
+        sh.stop()
+
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 0)
+
+    def test_waiting_tasks_drain_in_sync_mode(self) -> None:
+        sh = Scheduler(
+            pool_size=2,
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file
+        )
+        for _ in range(5):
+            sh.schedule(Job(func=spin, args=[0]))
+        sh.start()
+        time.sleep(1)
+        sh.stop()
+
+        self.assertEqual(len(os.listdir(self.tasks_folder)), 0)
+
+    def test_metrics_dump(self) -> None:
+        sh = Scheduler(
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            metrics_file=self.metrics_file
+        )
+        sh.start()
+        time.sleep(0.5)
+        sh.schedule(Job(file_system.error_func, tries=3))
+        sh.schedule(Job(func=time.sleep, args=[5], max_working_time=0.2))
+        sh.schedule(Job(func=spin, args=[0.1]))
+        time.sleep(1.5)
+        snapshot = sh.metrics_snapshot()
+        sh.stop()
+
+        with open(self.metrics_file, 'r') as file:
+            metrics = json.load(file)
+        functions = metrics['functions']
+        self.assertEqual(functions['error_func']['failed'], 1)
+        self.assertEqual(functions['error_func']['retried'], 2)
+        self.assertEqual(
+            snapshot['functions']['spin'], metrics['functions']['spin']
+        )
+        self.assertEqual(functions['sleep']['timed_out'], 1)
+        self.assertEqual(functions['spin']['submitted'], 1)
+        self.assertEqual(functions['spin']['succeeded'], 1)
+        self.assertEqual(functions['spin']['execution_seconds']['count'], 1)
+        self.assertEqual(functions['spin']['queue_wait_seconds']['count'], 1)
+        self.assertEqual(metrics['gauges']['running_tasks'], 0)
+
+    def test_metrics_count_submissions_before_start(self) -> None:
+        sh = Scheduler(
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            metrics_file=self.metrics_file
+        )
+        sh.schedule(Job(func=spin, args=[0]))
+        sh.schedule_many([Job(func=spin, args=[0]) for _ in range(2)])
+        sh.start()
+        sh.schedule(Job(func=spin, args=[0]))
+        time.sleep(1)
+        sh.stop()
+
+        with open(self.metrics_file, 'r') as file:
+            spin_metrics = json.load(file)['functions']['spin']
+        self.assertEqual(spin_metrics['submitted'], 4)
+        self.assertEqual(spin_metrics['succeeded'], 4)
+
+    def test_unknown_execution_mode(self) -> None:
+        with self.assertRaises(ValueError):
+            Scheduler(
+                tasks_folder=self.tasks_folder,
+                execution_mode='fibers'
+            )
+
+
+class StatusJournalTest(unittest.TestCase):
+    statuses_file = 'test_journal_statuses.txt'
+
+    def tearDown(self) -> None:
+        for file_name in (self.statuses_file,
+                          self.statuses_file + '.journal'):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+    def test_replay_snapshot_and_journal(self) -> None:
+        journal = StatusJournal(self.statuses_file)
+        for uid in ('1', '2', '3'):
+            journal.append([uid, '', 'foo', '[]', 'wait'])
+        journal.append(['2', '', 'foo', '[]', 'finished'])
+        self.assertFalse(os.path.exists(self.statuses_file))
+
+        restored = StatusJournal(self.statuses_file).load()
+        self.assertEqual(list(restored), ['1', '3'])
+
+    def test_compaction(self) -> None:
+        journal = StatusJournal(self.statuses_file, compact_every=3)
+        journal.append(['1', '', 'foo', '[]', 'wait'])
+        journal.append(['2', '', 'foo', '[]', 'wait'])
+        journal.append(['1', '', 'foo', '[]', 'fail'])
+
+        with open(self.statuses_file, 'r') as status_file:
+            self.assertEqual(status_file.readlines(), ['2;;foo;[];wait\n'])
+        self.assertEqual(os.path.getsize(journal.journal_file), 0)
+        self.assertEqual(list(journal.load()), ['2'])
+
+
+class WaitingQueueTest(unittest.TestCase):
+    waiting_file = 'test_waiting_queue.txt'
+
+    def tearDown(self) -> None:
+        for file_name in (self.waiting_file, self.waiting_file + '.journal'):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+    @staticmethod
+    def _record(uid: str, priority: int, enqueued_at: float) -> list[str]:
+        return [uid, '', 'foo', '[]', 'wait', str(priority), str(enqueued_at)]
+
+    def test_priority_order_and_bulk_pop(self) -> None:
+        queue = WaitingQueue(self.waiting_file)
+        queue.push(self._record('low', 0, 100))
+        queue.push(self._record('high', 5, 200))
+        queue.push(self._record('middle', 1, 300))
+        queue.push(self._record('low-later', 0, 400))
+
+        popped = queue.pop_many(3)
+        self.assertEqual([t[0] for t in popped], ['high', 'middle', 'low'])
+
+        restored = WaitingQueue(self.waiting_file)
+        restored.load()
+        self.assertEqual(len(restored), 1)
+        self.assertEqual(restored.pop_many(5)[0][0], 'low-later')
+
+    def test_aging_prevents_starvation(self) -> None:
+        queue = WaitingQueue(self.waiting_file, aging=1.0)
+        queue.push(self._record('old-low', 0, 0))
+        queue.push(self._record('new-high', 5, 600))
+
+        self.assertEqual(queue.pop_many(1)[0][0], 'old-low')
+
+    def test_weighted_fair_queuing(self) -> None:
+        queue = WaitingQueue(self.waiting_file, weights={'small': 2})
+        for index in range(6):
+            queue.push(self._record(f'bulk-{index}', 0, index) + ['', 'bulk'])
+        for index in range(3):
+            queue.push(
+                self._record(f'small-{index}', 0, 10 + index) + ['', 'small']
+            )
+
+        self.assertEqual(queue.backlog, {'bulk': 6, 'small': 3})
+        self.assertEqual([task[0] for task in queue.pop_many(5)], [
+            'bulk-0', 'small-0', 'small-1', 'bulk-1', 'small-2'
+        ])
+        self.assertEqual(queue.backlog, {'bulk': 4, 'small': 0})
+
+        restored = WaitingQueue(self.waiting_file)
+        restored.load()
+        self.assertEqual(restored.backlog, {'bulk': 4})
+
+    def test_lazy_recovery_from_checkpoint(self) -> None:
+        queue = WaitingQueue(self.waiting_file)
+        for index in range(50):
+            queue.push(self._record(f'task-{index}', index % 7, index))
+        expected = [
+            f'task-{index}'
+            for index in sorted(range(50), key=lambda i: (-(i % 7), i))
+        ]
+        queue.pop_many(3)
+        queue.compact()
+        queue.push(self._record('urgent', 10, 100))
+        queue.pop_many(1)
+        queue.push(self._record('late', 10, 200))
+
+        restored = WaitingQueue(self.waiting_file, batch_size=5)
+        restored.load()
+        self.assertLessEqual(
+            sum(len(heap) for heap in restored.heaps.values()), 6
+        )
+        self.assertEqual(len(restored), 48)
+        self.assertEqual(
+            [task[0] for task in restored.pop_many(50)],
+            ['late'] + expected[3:]
+        )
+
+    def test_compaction_keeps_lazily_recovered_tasks(self) -> None:
+        queue = WaitingQueue(self.waiting_file)
+        for index in range(20):
+            queue.push(self._record(f'task-{index}', 0, index))
+        queue.compact()
+
+        restored = WaitingQueue(
+            self.waiting_file, compact_every=5, batch_size=3
+        )
+        restored.load()
+        popped: list[str] = []
+        while batch := restored.pop_many(3):
+            popped.extend(task[0] for task in batch)
+        self.assertEqual(popped, [f'task-{index}' for index in range(20)])
+        self.assertEqual(len(restored), 0)
+
+    def test_compaction_forgets_old_dequeued_uids(self) -> None:
+        queue = WaitingQueue(self.waiting_file, compact_every=5)
+        for index in range(100):
+            queue.push(self._record(f'task-{index}', 0, index))
+            queue.pop_many(1)
+        recent = queue.dequeued | queue.previous_dequeued
+
+        self.assertLessEqual(len(recent), 10)
+        self.assertIn('task-99', recent)
+        queue.apply(self._record('task-99', 0, 99))
+        self.assertEqual(len(queue), 0)
+
+
+class SQLiteTaskStoreTest(unittest.TestCase):
+    database = 'test_tasks.db'
+
+    def tearDown(self) -> None:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def test_task_lifecycle(self) -> None:
+        store = SQLiteTaskStore(self.database)
+        job = Job(
+            func=requests.example_str_foo,
+            start_at='20-12-2099 15:10:00'
+        )
+        job.uid = 'task-1'
+        store.save(job)
+
+        loaded = store.load('task-1')
+        assert loaded is not None
+        self.assertEqual(loaded.run(), (None, 0))
+        self.assertEqual(store.find(state='wait'), ['task-1'])
+        self.assertEqual(store.find(func_name='example_str_foo'), ['task-1'])
+        self.assertEqual(store.find(due_before=time.time()), [])
+
+        store.set_state('task-1', 'running', attempt=True)
+        self.assertEqual(store.find(state='running'), ['task-1'])
+        self.assertEqual(store.attempts('task-1'), 1)
+
+        self.assertTrue(store.delete('task-1'))
+        self.assertFalse(store.delete('task-1'))
+        self.assertIsNone(store.load('task-1'))
+
+    def test_completed_dependencies_survive_reload(self) -> None:
+        calls.clear()
+        store = SQLiteTaskStore(self.database)
+        job = Job(
+            func=fail_once,
+            dependencies=[Job(func=sleep_and_return, args=['dep'])]
+        )
+        job.uid = 'task-1'
+        assign_uids(job)
+        store.save(job)
+
+        first = store.load('task-1')
+        assert first is not None
+        self.assertIsNone(first.run())
+        second = store.load('task-1')
+        assert second is not None
+        self.assertEqual(second.run(), ('ok', 1))
+        self.assertEqual(calls.count('dep'), 1)
+
+    def test_leases(self) -> None:
+        store = SQLiteTaskStore(self.database)
+        job = Job(func=spin, args=[0])
+        job.uid = 'task-1'
+        store.save(job)
+
+        self.assertEqual(store.claim('task-1', 'a', 0.2), LEASE_CLAIMED)
+        self.assertEqual(store.claim('task-1', 'b', 0.2), LEASE_BUSY)
+        self.assertEqual(store.claimable(time.time(), 10), [])
+        store.renew('a', ['task-1'], 0.2)
+        time.sleep(0.3)
+        self.assertEqual(
+            store.claimable(time.time(), 10), [('task-1', 0.0, 'spin')]
+        )
+        self.assertEqual(store.claim('task-1', 'b', 10), LEASE_CLAIMED)
+        store.release('task-1', 'a')
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_BUSY)
+        store.release('task-1', 'b')
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_CLAIMED)
+        store.delete('task-1')
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_MISSING)
+
+    def test_defer_keeps_lease_and_retry_state(self) -> None:
+        store = SQLiteTaskStore(self.database)
+        job = Job(func=spin, args=[0], tries=3)
+        job.uid = 'task-1'
+        store.save(job)
+        store.claim('task-1', 'a', 10)
+        job.attempts, job.retry_delay = 2, 1.5
+        due_at = time.time() + 0.3
+        store.defer(job, 'a', due_at)
+
+        self.assertEqual(store.claimable(time.time(), 10), [])
+        self.assertEqual(store.claim('task-1', 'b', 10), LEASE_BUSY)
+        self.assertEqual(store.claim('task-1', 'a', 10), LEASE_CLAIMED)
+        store.defer(job, 'a', due_at)
+        time.sleep(0.4)
+        self.assertEqual(
+            store.claimable(time.time(), 10), [('task-1', due_at, 'spin')]
+        )
+        loaded = store.load('task-1')
+        assert loaded is not None
+        self.assertEqual((loaded.attempts, loaded.retry_delay), (2, 1.5))
+
+
+class ResourceLimiterTest(unittest.TestCase):
+    def test_token_bucket(self) -> None:
+        bucket = TokenBucket(rate=2, burst=2)
+
+        self.assertEqual(bucket.available(100.0), 2)
+        bucket.consume(100.0)
+        bucket.consume(100.0)
+        self.assertEqual(bucket.available(100.0), 0)
+        self.assertEqual(bucket.next_token_at(100.0), 100.5)
+        self.assertEqual(bucket.available(100.5), 1)
+        self.assertEqual(bucket.available(110.0), 2)
+
+    def test_park_blocked_classes(self) -> None:
+        limiter = ResourceLimiter({'cpu': 1}, {'host': 1})
+
+        self.assertIsNone(limiter.acquire(['cpu'], 100.0))
+        self.assertEqual(limiter.acquire(['cpu'], 100.0), 'cpu')
+        self.assertIsNone(limiter.acquire(['net'], 100.0))
+        self.assertIsNone(limiter.acquire(['host'], 100.0))
+        self.assertEqual(limiter.acquire(['net', 'host'], 100.0), 'host')
+        limiter.park('cpu', 'cpu-task')
+        limiter.park('host', 'host-task')
+
+        self.assertEqual(limiter.unpark(100.0), [])
+        self.assertEqual(limiter.next_wake(100.0), 101.0)
+        self.assertEqual(limiter.unpark(101.0), ['host-task'])
+        limiter.release(['cpu'])
+        self.assertEqual(limiter.unpark(101.0), ['cpu-task'])
+        self.assertEqual(len(limiter), 0)
+
+
+class ScheduleTest(unittest.TestCase):
+    @staticmethod
+    def timestamp(value: str) -> float:
+        return datetime.strptime(value, START_AT_FORMAT).timestamp()
+
+    def test_cron_next_fire(self) -> None:
+        since = self.timestamp('30-12-2099 23:59:30')
+        cases = {
+            '*/15 * * * *': '31-12-2099 00:00:00',
+            '30 9 * * 1-5': '31-12-2099 09:30:00',
+            '0 12 1 * *': '01-01-2100 12:00:00',
+            '0 0 29 2 *': '29-02-2104 00:00:00',
+            '@weekly': '03-01-2100 00:00:00',
+            '0 8 13 * 5': '01-01-2100 08:00:00'
+        }
+        for expression, expected in cases.items():
+            self.assertEqual(
+                CronSchedule(expression).next_fire(since),
+                self.timestamp(expected), expression
+            )
+        self.assertIsNone(CronSchedule('0 0 31 2 *').next_fire(since))
+        with self.assertRaises(ValueError):
+            CronSchedule('61 * * * *')
+        with self.assertRaises(ValueError):
+            CronSchedule('* * *')
+
+    def test_bounded_schedules(self) -> None:
+        schedule = IntervalSchedule(
+            60, start_at='20-12-2099 15:10:00',
+            end_at='20-12-2099 15:13:00'
+        )
+        start = self.timestamp('20-12-2099 15:10:00')
+        self.assertEqual(schedule.next_fire(0), start)
+        self.assertEqual(schedule.next_fire(start + 1), start + 60)
+        self.assertEqual(schedule.next_fire(start + 180), start + 180)
+        self.assertIsNone(schedule.next_fire(start + 181))
+
+        cron = CronSchedule('0 * * * *', start_at='20-12-2099 15:10:00',
+                            count=2)
+        self.assertEqual(cron.next_fire(0, fired=1), start + 50 * 60)
+        self.assertIsNone(cron.next_fire(0, fired=2))
+
+    def test_schedule_survives_serialization(self) -> None:
+        cron = CronSchedule('@hourly')
+        job = Job(func=spin, args=[0], schedule=cron)
+        job.uid = 'task-1'
+
+        schedule = load_job(dump_job(job)).schedule
+        assert isinstance(schedule, CronSchedule)
+        self.assertEqual(schedule.minutes, [0])
+        self.assertEqual(schedule.next_fire(1e9), cron.next_fire(1e9))
+
+
+class SerializationTest(unittest.TestCase):
+    def test_compact_round_trip(self) -> None:
+        shared = Job(func=sleep_and_return, args=['shared'])
+        job = Job(
+            func=join_names, kwargs={'x': 'y'},
+            dependencies=[
+                Job(func=sleep_and_return, args=['left'],
+                    dependencies=[shared], return_arg='left'),
+                Job(func=sleep_and_return, args=['right'],
+                    dependencies=[shared], return_arg='right')
+            ],
+            start_at='20-12-2099 15:10:00', dependency_mode='graph'
+        )
+        job.uid = 'task-1'
+        assign_uids(job)
+        data = dump_job(job)
+        restored = load_job(data)
+
+        self.assertLess(len(data), len(pickle.dumps(job)))
+        self.assertEqual(restored.uid, 'task-1')
+        self.assertIs(restored.func, join_names)
+        self.assertEqual(restored.kwargs, {'x': 'y'})
+        self.assertEqual(restored.dependency_mode, 'graph')
+        self.assertIs(
+            restored.dependencies[0].dependencies[0],
+            restored.dependencies[1].dependencies[0]
+        )
+
+    def test_fallback_to_pickle(self) -> None:
+        data = dump_job(Job(func='{a}'.format, kwargs={'a': 'b'}))
+
+        self.assertTrue(data.startswith(PICKLE_FORMAT))
+        self.assertEqual(load_job(data).run(), ('b', 1))
+
+
+class MetricsTest(unittest.TestCase):
+    def test_histograms_and_prometheus_output(self) -> None:
+        metrics = Metrics()
+        for value in (0.002, 0.02, 0.2, 2):
+            metrics.observe('queue_wait_seconds', 'get_data', value)
+        metrics.increment('started', 'get_data')
+        metrics.increment('started', 'read_file', 2)
+        metrics.set_gauge('running_tasks', 3)
+        histogram = metrics.histogram('queue_wait_seconds', 'get_data')
+        assert histogram is not None
+        text = metrics.to_prometheus()
+
+        self.assertEqual(metrics.counter('started'), 3)
+        self.assertEqual(histogram.quantile(0.5), 0.025)
+        self.assertAlmostEqual(histogram.quantile(0.99), 2.44)
+        self.assertIn(
+            'scheduler_tasks_total{event="started",func="read_file"} 2', text
+        )
+        self.assertIn(
+            'scheduler_queue_wait_seconds_bucket{func="get_data",le="+Inf"} 4',
+            text
+        )
+        self.assertIn('scheduler_running_tasks 3', text)
+
+    def test_quantiles_interpolate_within_bucket(self) -> None:
+        histogram = Histogram()
+        for index in range(100):
+            histogram.observe(0.5 + (index + 1) / 200)
+
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.75)
+        self.assertAlmostEqual(histogram.quantile(0.9), 0.95)
+        self.assertEqual(Histogram().quantile(0.5), 0.0)
+
+
+class StructuredLoggingTest(unittest.TestCase):
+    log_file = 'test_events.log'
+
+    def tearDown(self) -> None:
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+
+    def test_job_events_are_written_as_json_lines(self) -> None:
+        calls.clear()
+        logger = config_logger('task_logger', self.log_file)
+        try:
+            job = Job(func=fail_once, tries=2)
+            job.run()
+            writer.flush()
+        finally:
+            config_logger('task_logger', 'tasks.log')
+        with open(self.log_file) as file:
+            events = [json.loads(line) for line in file]
+
+        self.assertEqual(
+            len([h for h in logger.handlers
+                 if isinstance(h, QueuedFileHandler)]), 1
+        )
+        self.assertEqual(
+            [(e['message'], e['attempt']) for e in events],
+            [('Job raised an exception', 1), ('Job finished', 2)]
+        )
+        self.assertEqual({e['uid'] for e in events}, {job.uid})
+        self.assertEqual(events[1]['func'], 'fail_once')
+        self.assertGreaterEqual(events[1]['duration'], 0)
+
+
+class SharedResultStoreTest(unittest.TestCase):
+    folder = './test_handoff/'
+
+    def tearDown(self) -> None:
+        file_system.delete_directory_with_files(self.folder)
+
+    def test_offload_and_release(self) -> None:
+        store = SharedResultStore(threshold=1024, folder=self.folder)
+        payload = ['row'] * 1000
+
+        self.assertEqual(store.offload('small'), 'small')
+        handle = store.offload(payload, consumers=2)
+        self.assertIsInstance(handle, ResultHandle)
+        self.assertLess(len(pickle.dumps(handle)), 200)
+        self.assertEqual(store.resolve(handle), payload)
+        self.assertFalse(handle.release())
+        self.assertEqual(pickle.loads(pickle.dumps(handle)).load(), payload)
+        self.assertTrue(handle.release())
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_dependencies_share_handles(self) -> None:
+        store = SharedResultStore(threshold=64, folder=self.folder)
+        shared = Job(func=sleep_and_return, args=['x' * 1000],
+                     return_arg='shared')
+        job = Job(
+            func=join_names, dependency_mode='graph', result_store=store,
+            dependencies=[
+                Job(func=join_names, dependencies=[shared],
+                    return_arg=name)
+                for name in ('left', 'right')
+            ]
+        )
+
+        self.assertEqual(job.run(), (','.join(['x' * 1000] * 2), 1))
+        self.assertTrue(all(
+            isinstance(value, ResultHandle)
+            for value, _ in job.completed_dependencies.values()
+        ))
+        self.assertLess(len(pickle.dumps(job)), 4000)
+        self.assertEqual(os.listdir(self.folder), [])
+
+        failing = Job(func=file_system.error_func, result_store=store,
+                      dependencies=[Job(func=sleep_and_return,
+                                        args=['y' * 1000])])
+        self.assertIsNone(failing.run())
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+class ProfilerTest(unittest.TestCase):
+    folder = './test_profiles/'
+    tasks_folder = './test_tasks/'
+    statuses_file = 'test_statuses.txt'
+    waiting_tasks_file = 'test_waiting_file.txt'
+
+    def tearDown(self) -> None:
+        for folder in (self.folder, self.tasks_folder):
+            file_system.delete_directory_with_files(folder)
+        for file_name in (self.statuses_file, self.waiting_tasks_file):
+            for suffix in ('', '.journal'):
+                if os.path.exists(file_name + suffix):
+                    os.remove(file_name + suffix)
+
+    def test_profiles_aggregate_per_function(self) -> None:
+        profiler = Profiler(self.folder, memory=True)
+        for name in ('a', 'b'):
+            Job(func=sleep_and_return, args=[name], profiler=profiler).run()
+        stats = pstats.Stats(profiler.stats_file('sleep_and_return'))
+        with open(profiler.memory_file('sleep_and_return')) as file:
+            memory = json.load(file)
+
+        self.assertEqual(
+            stats.get_stats_profile().func_profiles['sleep_and_return'].ncalls,
+            '2'
+        )
+        self.assertEqual(memory['runs'], 2)
+        self.assertGreater(memory['peak_bytes'], 0)
+        with self.assertRaises(ValueError):
+            Profiler(self.folder, sample_rate=0)
+
+    def test_profiled_jobs_time_out_cleanly(self) -> None:
+        profiler = Profiler(self.folder)
+        jobs = [Job(func=busy_wait, args=[index % 2 * 0.02],
+                    max_working_time=0.001, profiler=profiler)
+                for index in range(100)]
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(Job.run, jobs, timeout=60))
+        for index in range(40):
+            Job(func=busy_wait, args=[index % 2 * 0.005],
+                max_working_time=0.001, profiler=profiler).run()
+        Job(func=sleep_and_return, args=['a'], profiler=profiler).run()
+
+        self.assertIn(None, results)
+        self.assertIn(('done', 1), results)
+        self.assertTrue(
+            os.path.exists(profiler.stats_file('sleep_and_return'))
+        )
+        self.assertEqual(monitor.active, {})
+        self.assertEqual(monitor.pending, {})
+
+    def test_scheduler_profiles_matching_functions(self) -> None:
+        sh = Scheduler(
+            tasks_folder=self.tasks_folder,
+            statuses_file=self.statuses_file,
+            waiting_tasks_file=self.waiting_tasks_file,
+            profiler=Profiler(self.folder, functions=['sleep_and_return'])
+        )
+        uid = sh.schedule(Job(func=join_names, dependencies=[
+            Job(func=sleep_and_return, args=['a'], return_arg='a')
+        ]))
+        assert uid is not None
+        job = sh.task_store.load(uid)
+        assert job is not None
+
+        self.assertIsNone(job.profiler)
+        self.assertIsNotNone(job.dependencies[0].profiler)
+        self.assertEqual(sh.run(uid), ('a', 1))
+        self.assertEqual(
+            sorted(os.listdir(self.folder)), ['.lock', 'sleep_and_return.prof']
+        )
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = 64 * 1024
+    clients: set = set()
+    posts = 0
+
+    def do_GET(self) -> None:
+        self.clients.add(self.client_address)
+        if self.path == '/users':
+            self._reply(200, json.dumps(
+                [{'name': 'stub 1'}, {'name': 'stub 2'}]
+            ).encode())
+        elif self.path == '/big':
+            self._reply(200, b'x' * 1_000_000)
+        elif self.path == '/slow':
+            time.sleep(0.5)
+            self._reply(200, b'slow')
+        elif self.path == '/stall':
+            self.send_response(200)
+            self.send_header('Content-Length', '2000')
+            self.end_headers()
+            self.wfile.write(b'x' * 1000)
+            self.wfile.flush()
+            time.sleep(0.5)
+        elif self.path == '/drop':
+            self._reply(200, b'dropped')
+            self.close_connection = True
+        else:
+            self._reply(404, b'missing')
+
+    def do_POST(self) -> None:
+        self.clients.add(self.client_address)
+        self.posts += 1
+        length = int(self.headers['Content-Length'])
+        self._reply(200, self.rfile.read(length))
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _reply(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class HttpJobTest(unittest.TestCase):
+    download_file = 'test_download.bin'
+
+    def setUp(self) -> None:
+        StubHandler.clients = set()
+        StubHandler.posts = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self) -> None:
+        default_pool().close()
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.download_file):
+            os.remove(self.download_file)
+
+    def test_requests_reuse_connections(self) -> None:
+        job = HttpJob(self.url + '/users', response_format='json')
+        for _ in range(20):
+            self.assertEqual(
+                job.run(), ([{'name': 'stub 1'}, {'name': 'stub 2'}], 1)
+            )
+        post = HttpJob(self.url + '/echo', method='POST',
+                       json_body={'key': 'value'}, response_format='json')
+
+        self.assertEqual(post.run(), ({'key': 'value'}, 1))
+        self.assertEqual(len(StubHandler.clients), 1)
+        self.assertEqual(
+            job.resources, [f'host:127.0.0.1:{self.server.server_port}']
+        )
+        restored = load_job(dump_job(job))
+        self.assertEqual(restored.run(), job.run())
+
+    def test_bounded_pool_and_streaming(self) -> None:
+        pool = ConnectionPool(max_per_host=4)
+        with ThreadPoolExecutor(16) as executor:
+            statuses = list(executor.map(
+                lambda _: pool.request('GET', self.url + '/users')[0],
+                range(200)
+            ))
+
+        self.assertEqual(statuses, [200] * 200)
+        self.assertLessEqual(pool.created, 4)
+        pool.close()
+
+        job = HttpJob(self.url + '/big', stream_to=self.download_file)
+        self.assertEqual(job.run(), (self.download_file, 1))
+        self.assertEqual(os.path.getsize(self.download_file), 1_000_000)
+
+        missing = HttpJob(self.url + '/missing', tries=1)
+        self.assertIsNone(missing.run())
+        self.assertEqual(missing.last_error, HttpStatusException.__name__)
+
+    def test_saturated_host_does_not_block_others(self) -> None:
+        pool = ConnectionPool(max_per_host=1, max_in_flight=2)
+        other = f'http://localhost:{self.server.server_port}/users'
+        with ThreadPoolExecutor(4) as executor:
+            slow = [executor.submit(pool.request, 'GET', self.url + '/slow')
+                    for _ in range(3)]
+            time.sleep(0.1)
+            started = time.time()
+            self.assertEqual(pool.request('GET', other)[0], 200)
+            self.assertLess(time.time() - started, 0.4)
+            self.assertEqual([f.result()[0] for f in slow], [200] * 3)
+        pool.close()
+
+    def test_failed_download_removes_partial_file(self) -> None:
+        pool = ConnectionPool()
+        with self.assertRaises(TimeoutError):
+            pool.request('GET', self.url + '/stall',
+                         stream_to=self.download_file, timeout=0.2)
+
+        self.assertFalse(os.path.exists(self.download_file + '.part'))
+        self.assertFalse(os.path.exists(self.download_file))
+        pool.close()
+
+    def test_only_idempotent_requests_are_replayed(self) -> None:
+        pool = ConnectionPool(max_per_host=1)
+        self.assertEqual(pool.request('GET', self.url + '/drop')[0], 200)
+        time.sleep(0.1)
+        with self.assertRaises(STALE_CONNECTION_ERRORS):
+            pool.request('POST', self.url + '/echo', b'payload')
+        self.assertEqual(StubHandler.posts, 0)
+
+        self.assertEqual(pool.request('GET', self.url + '/drop')[0], 200)
+        time.sleep(0.1)
+        self.assertEqual(pool.request('GET', self.url + '/users')[0], 200)
+        self.assertEqual(pool.created, 3)
+        pool.close()
+
+
+class ResultCacheTest(unittest.TestCase):
+    cache_folder = './test_cache/'
+
+    def tearDown(self) -> None:
+        file_system.delete_directory_with_files(self.cache_folder)
+
+    def test_job_result_is_reused(self) -> None:
+        calls.clear()
+        cache = ResultCache(self.cache_folder)
+        job = Job(func=sleep_and_return, args=['cached'], cache_ttl=60,
+                  result_cache=cache)
+
+        self.assertEqual(job.run(), ('cached', 1))
+        self.assertEqual(job.run(), ('cached', 1))
+        self.assertEqual(calls.count('cached'), 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+        restored = ResultCache(self.cache_folder)
+        key = restored.key(sleep_and_return, ['cached'], {})
+        assert key is not None
+        self.assertEqual(restored.get(key), (True, 'cached'))
+
+    def test_ttl_and_lru_eviction(self) -> None:
+        cache = ResultCache(max_entries=2)
+        cache.put('expired', 1, ttl=-1)
+        cache.put('a', 1, ttl=60)
+        cache.put('b', 2, ttl=60)
+        cache.get('a')
+        cache.put('c', 3, ttl=60)
+
+        self.assertEqual(cache.get('expired'), (False, None))
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.get('c'), (True, 3))
+
+    def test_disk_size_eviction(self) -> None:
+        cache = ResultCache(self.cache_folder, max_disk_bytes=3000)
+        for index in range(5):
+            cache.put(str(index), 'x' * 1000, ttl=60)
+            time.sleep(0.01)
+
+        self.assertLessEqual(len(os.listdir(self.cache_folder)), 2)
+        self.assertIn('4', os.listdir(self.cache_folder))
+
+    def test_disk_size_is_tracked_across_restart(self) -> None:
+        cache = ResultCache(self.cache_folder, max_disk_bytes=3000)
+        for index in range(2):
+            cache.put(str(index), 'x' * 1000, ttl=60)
+            time.sleep(0.01)
+
+        restored = ResultCache(self.cache_folder, max_disk_bytes=3000)
+        with mock.patch('cache.os.scandir', side_effect=AssertionError):
+            restored.put('2', 'x' * 1000, ttl=60)
+
+        self.assertEqual(sorted(os.listdir(self.cache_folder)), ['1', '2'])
+        self.assertLessEqual(restored.disk_bytes, 3000)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,20 +1,21 @@
 import logging
 import uuid
 
-from exceptions import WorkingTimeoutException
+from datetime import datetime
 
+from logs import QueuedFileHandler
 
-def handler_alarm(signum, frame):
-    raise WorkingTimeoutException
+
+START_AT_FORMAT = '%d-%m-%Y %H:%M:%S'
 
 
 def config_logger(name, log_file, level=logging.INFO):
-    formatter = logging.Formatter('%(levelname)s %(asctime)s %(message)s')
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
     logger = logging.getLogger(name)
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueuedFileHandler):
+            logger.removeHandler(handler)
+    logger.addHandler(QueuedFileHandler(log_file))
     logger.setLevel(level)
-    logger.addHandler(handler)
     return logger
 
 
@@ -28,3 +29,13 @@ def is_valid_uuid(value):
         return True
     except ValueError:
         return False
+
+
+def parse_start_at(start_at: str) -> float:
+    if not start_at:
+        return 0.0
+    return datetime.strptime(start_at, START_AT_FORMAT).timestamp()
+
+
+def format_start_at(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime(START_AT_FORMAT)